@@ -0,0 +1,327 @@
+"""Archivio su disco dei run di assegnazione, riapribili senza ricalcolo.
+
+Per ogni insieme di file in ingresso (chiave: hash del contenuto, come in
+`ingestione.CacheIngestione`) l'archivio conserva le quattro tabelle
+normalizzate; per ogni run (chiave: ingresso, parametri e versione
+dell'algoritmo) i risultati e l'eventuale confronto tra modalità. Le
+tabelle sono scritte in Parquet; nomi delle colonne (anche numerici) e
+`attrs` sono salvati a parte in `info.json` e ripristinati alla lettura,
+così i DataFrame riletti sono uguali a quelli salvati.
+
+Parquet non ammette colonne con valori di tipi diversi (ad esempio codici
+negozio numerici e "Nessun negozio disponibile"): vengono scritte come
+testo, affiancate da una colonna con il tipo di ogni valore, da cui i
+valori originali vengono ricostruiti alla lettura. I tipi fuori da
+`TIPI_VALORI` e dagli scalari numerici numpy vengono riletti come testo.
+
+Ogni voce è una cartella scritta in una cartella temporanea e poi
+rinominata, quindi una scrittura interrotta non lascia voci incomplete.
+Lo spazio occupato è limitato a `max_byte`: oltre il limite vengono
+eliminate le voci usate meno di recente.
+
+Struttura:
+
+    <cartella>/ingressi/<chiave_input>/{st,avanzamenti,prelievi,stock}.parquet, info.json
+    <cartella>/run/<chiave_run>/risultati.parquet, [confronto.parquet], info.json
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from assegnazione import VERSIONE_ALGORITMO, riepilogo_risultati
+from esportazione import colonne_miste
+
+CARTELLA_PREDEFINITA = 'archivio_run'
+
+# Spazio massimo occupato dall'archivio, in byte
+MAX_BYTE_PREDEFINITO = 2 * 2 ** 30
+
+# Tabelle in ingresso, nell'ordine di `carica_tabelle`
+TABELLE_INGRESSO = ('st', 'avanzamenti', 'prelievi', 'stock')
+
+# Parametri che non cambiano i risultati e quindi non fanno parte della chiave
+PARAMETRI_ESCLUSI = ('workers',)
+
+SOTTOCARTELLE = ('ingressi', 'run')
+
+# Formato delle voci su disco; fa parte della chiave dei run come VERSIONE_ALGORITMO
+VERSIONE_ARCHIVIO = 2
+
+# Tipi dei valori delle colonne miste, per nome, e come ricostruirli dal testo;
+# gli scalari numerici numpy ("numpy.int64", ...) sono ricostruiti dal loro dtype
+TIPI_VALORI = {
+    'str': str,
+    'int': int,
+    'float': float,
+    'bool': lambda testo: testo == 'True',
+    'numpy.bool': lambda testo: np.bool_(testo == 'True'),
+    'NoneType': lambda testo: None,
+    'NAType': lambda testo: pd.NA,
+    'NaTType': lambda testo: pd.NaT,
+}
+
+# Prefisso delle colonne con i tipi dei valori di una colonna mista, seguito dalla posizione
+PREFISSO_TIPI = '__tipi_'
+
+
+def parametri_run(params):
+    """Parametri di `ParametriAssegnazione` che determinano i risultati."""
+    return {nome: valore for nome, valore in asdict(params).items() if nome not in PARAMETRI_ESCLUSI}
+
+
+def chiave_run(chiave_input, params):
+    """Chiave di un run: hash della chiave dei file in ingresso, dei parametri e delle versioni."""
+    h = hashlib.sha256(chiave_input.encode())
+    h.update(json.dumps(parametri_run(params), sort_keys=True).encode())
+    h.update(f"{VERSIONE_ALGORITMO}/{VERSIONE_ARCHIVIO}".encode())
+    return h.hexdigest()
+
+
+def _nome_json(nome):
+    return nome.item() if isinstance(nome, np.generic) else nome
+
+
+def _scrivi_info(info, cartella):
+    info = {'formato': VERSIONE_ARCHIVIO, **info}
+    with open(cartella / 'info.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, default=_nome_json)
+
+
+def _tipo_valore(valore):
+    if isinstance(valore, (np.integer, np.floating)):
+        return f"numpy.{type(valore).__name__}"
+    if isinstance(valore, np.bool_):
+        return 'numpy.bool'
+    nome = type(valore).__name__
+    return nome if nome in TIPI_VALORI else 'str'
+
+
+def _valore(tipo, testo):
+    ricostruisci = TIPI_VALORI.get(tipo)
+    if ricostruisci is None:
+        return np.dtype(tipo.removeprefix('numpy.')).type(testo)
+    return ricostruisci(testo)
+
+
+def _scrivi_tabella(df, percorso):
+    """Scrive `df` in Parquet con nomi di colonna testuali e le colonne miste come testo.
+
+    Restituisce i nomi originali delle colonne e le posizioni delle colonne miste.
+    """
+    colonne = [_nome_json(c) for c in df.columns]
+    df = df.set_axis([str(c) for c in colonne], axis=1)
+    miste = [df.columns.get_loc(c) for c in colonne_miste(df)]
+    for posizione in miste:
+        valori = df.iloc[:, posizione]
+        df[f"{PREFISSO_TIPI}{posizione}"] = pd.Categorical([_tipo_valore(v) for v in valori])
+        df.isetitem(posizione, [str(v) for v in valori])
+    df.to_parquet(percorso)
+    return colonne, miste
+
+
+def _leggi_tabella(percorso, colonne, attrs=None, miste=None):
+    df = pd.read_parquet(percorso, memory_map=True)
+    for posizione in miste or ():
+        tipi = df.pop(f"{PREFISSO_TIPI}{posizione}")
+        valori = [_valore(tipo, testo) for tipo, testo in zip(tipi, df.iloc[:, posizione])]
+        df.isetitem(posizione, pd.Series(valori, index=df.index, dtype=object))
+    df.columns = colonne
+    df.attrs.update(attrs or {})
+    return df
+
+
+def _dimensione(cartella):
+    return sum(f.stat().st_size for f in cartella.iterdir())
+
+
+class ArchivioRun:
+    """Tabelle in ingresso e risultati dei run, su disco, con evizione LRU per spazio.
+
+    L'ultimo accesso a una voce è la data di modifica della sua cartella,
+    aggiornata a ogni lettura.
+    """
+
+    def __init__(self, cartella=CARTELLA_PREDEFINITA, max_byte=MAX_BYTE_PREDEFINITO):
+        self.cartella = Path(cartella)
+        self.max_byte = max_byte
+        self.hit = 0
+        self.miss = 0
+        self.evizioni = 0
+        for nome in SOTTOCARTELLE:
+            (self.cartella / nome).mkdir(parents=True, exist_ok=True)
+
+    def _voce(self, tipo, chiave):
+        return self.cartella / tipo / chiave
+
+    def _scrivi_voce(self, tipo, chiave, scrivi):
+        """Scrive una voce con `scrivi(cartella_temporanea)` e la pubblica con una rinomina."""
+        temporanea = Path(tempfile.mkdtemp(prefix=f".{chiave[:12]}-", dir=self.cartella / tipo))
+        try:
+            scrivi(temporanea)
+            destinazione = self._voce(tipo, chiave)
+            if destinazione.exists():
+                shutil.rmtree(destinazione, ignore_errors=True)
+            os.replace(temporanea, destinazione)
+        finally:
+            if temporanea.exists():
+                shutil.rmtree(temporanea, ignore_errors=True)
+        self.evici(proteggi=destinazione)
+
+    def _leggi_info(self, tipo, chiave):
+        """info.json della voce, aggiornandone l'ultimo accesso.
+
+        None se la voce non c'è o è stata scritta in un formato precedente.
+        """
+        cartella = self._voce(tipo, chiave)
+        try:
+            with open(cartella / 'info.json', encoding='utf-8') as f:
+                info = json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if info.get('formato') != VERSIONE_ARCHIVIO:
+            return None
+        os.utime(cartella)
+        return info
+
+    def contiene_ingresso(self, chiave_input):
+        return self._leggi_info('ingressi', chiave_input) is not None
+
+    def salva_ingresso(self, chiave_input, tabelle, file=None):
+        """Salva le tabelle normalizzate (st, avanzamenti, prelievi, stock), se non già presenti.
+
+        `file` sono i nomi dei file caricati, mostrati nell'elenco dei run.
+        """
+        if self.contiene_ingresso(chiave_input):
+            return
+
+        def scrivi(cartella):
+            info = {'chiave_input': chiave_input, 'file': list(file or []), 'colonne': {}, 'miste': {}, 'attrs': {}}
+            for nome, df in zip(TABELLE_INGRESSO, tabelle):
+                info['colonne'][nome], info['miste'][nome] = _scrivi_tabella(df, cartella / f"{nome}.parquet")
+                info['attrs'][nome] = df.attrs
+            _scrivi_info(info, cartella)
+
+        self._scrivi_voce('ingressi', chiave_input, scrivi)
+
+    def carica_ingresso(self, chiave_input):
+        """Tabelle (st, avanzamenti, prelievi, stock) salvate, oppure None."""
+        info = self._leggi_info('ingressi', chiave_input)
+        if info is None:
+            return None
+        cartella = self._voce('ingressi', chiave_input)
+        return tuple(
+            _leggi_tabella(
+                cartella / f"{nome}.parquet", info['colonne'][nome], info['attrs'][nome], info['miste'][nome]
+            )
+            for nome in TABELLE_INGRESSO
+        )
+
+    def salva_run(self, chiave_input, params, df_results, df_confronto=None, tempo_s=None):
+        """Salva i risultati di un run e restituisce la sua chiave."""
+        chiave = chiave_run(chiave_input, params)
+
+        def scrivi(cartella):
+            colonne, miste = _scrivi_tabella(df_results, cartella / 'risultati.parquet')
+            info = {
+                'chiave_input': chiave_input,
+                'parametri': parametri_run(params),
+                'versione': VERSIONE_ALGORITMO,
+                'creato': datetime.now().isoformat(timespec='seconds'),
+                'tempo_s': tempo_s,
+                'riepilogo': riepilogo_risultati(df_results),
+                'colonne': colonne,
+                'miste': miste,
+            }
+            if df_confronto is not None:
+                info['colonne_confronto'], info['miste_confronto'] = _scrivi_tabella(
+                    df_confronto, cartella / 'confronto.parquet'
+                )
+            _scrivi_info(info, cartella)
+
+        self._scrivi_voce('run', chiave, scrivi)
+        return chiave
+
+    def carica_run(self, chiave):
+        """(info, df_results, df_confronto o None) del run salvato, oppure None."""
+        info = self._leggi_info('run', chiave)
+        if info is None:
+            self.miss += 1
+            return None
+        self.hit += 1
+        cartella = self._voce('run', chiave)
+        df_results = _leggi_tabella(cartella / 'risultati.parquet', info['colonne'], miste=info['miste'])
+        df_confronto = None
+        if 'colonne_confronto' in info:
+            df_confronto = _leggi_tabella(
+                cartella / 'confronto.parquet', info['colonne_confronto'], miste=info['miste_confronto']
+            )
+        return info, df_results, df_confronto
+
+    def elenco_run(self):
+        """Info dei run salvati con la loro chiave, dal più recente."""
+        elenco = []
+        for cartella in (self.cartella / 'run').iterdir():
+            if cartella.name.startswith('.'):
+                continue
+            try:
+                with open(cartella / 'info.json', encoding='utf-8') as f:
+                    info = json.load(f)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if info.get('formato') != VERSIONE_ARCHIVIO:
+                continue
+            ingresso = self._voce('ingressi', info['chiave_input']) / 'info.json'
+            if ingresso.exists():
+                with open(ingresso, encoding='utf-8') as f:
+                    info['file'] = json.load(f)['file']
+            elenco.append({'chiave': cartella.name, **info})
+        return sorted(elenco, key=lambda info: info['creato'], reverse=True)
+
+    def _voci(self):
+        """(ultimo accesso, dimensione, cartella) di tutte le voci complete."""
+        voci = []
+        for tipo in SOTTOCARTELLE:
+            for cartella in (self.cartella / tipo).iterdir():
+                if cartella.name.startswith('.'):
+                    continue
+                try:
+                    voci.append((cartella.stat().st_mtime, _dimensione(cartella), cartella))
+                except FileNotFoundError:
+                    continue
+        return voci
+
+    def dimensione(self):
+        return sum(dimensione for _, dimensione, _ in self._voci())
+
+    def evici(self, proteggi=None):
+        """Elimina le voci usate meno di recente finché l'archivio sta in `max_byte`.
+
+        La voce `proteggi` (appena scritta) non viene eliminata.
+        """
+        voci = sorted(self._voci(), key=lambda voce: voce[0])
+        occupati = sum(dimensione for _, dimensione, _ in voci)
+        for _, dimensione, cartella in voci:
+            if occupati <= self.max_byte:
+                break
+            if cartella == proteggi:
+                continue
+            shutil.rmtree(cartella, ignore_errors=True)
+            occupati -= dimensione
+            self.evizioni += 1
+
+    def statistiche(self):
+        return {
+            'run': sum(1 for c in (self.cartella / 'run').iterdir() if not c.name.startswith('.')),
+            'dimensione_mb': self.dimensione() / 2 ** 20,
+            'hit': self.hit,
+            'miss': self.miss,
+            'evizioni': self.evizioni,
+        }
@@ -0,0 +1,426 @@
+"""Algoritmo di assegnazione dei pallet ai negozi, indipendente da Streamlit.
+
+Ogni pallet viene assegnato, nell'ordine del file PRELIEVI, al negozio
+valido non ancora assegnato con punteggio P più alto. I pallet rimasti
+senza negozio passano poi alla riassegnazione automatica, che ammette più
+pallet per negozio fino alla soglia massima di valore.
+
+Uso tipico:
+
+    df, df_avanzamenti, df_prelievi, df_stock = carica_tabelle(...)
+    df_results = assign_pallets(df, df_avanzamenti, df_prelievi, df_stock, ParametriAssegnazione())
+
+Per file PRELIEVI molto grandi i pallet possono arrivare in streaming:
+
+    df, df_avanzamenti, df_stock = carica_tabelle_negozi(...)
+    flusso = FlussoPrelievi('PRELIEVI.xlsx')
+    df_results = assegna_pallet_in_streaming(df, df_avanzamenti, df_stock, flusso.pallet(), params, totale=flusso.totale)
+"""
+import time
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from modello_dati import ModelloDati
+from punteggi import CacheComponenti, CachePunteggi
+from punteggi_paralleli import precalcola_punteggi
+from strumentazione import fase
+
+NESSUN_NEGOZIO = "Nessun negozio disponibile"
+NESSUN_NEGOZIO_FUNZIONI = "Nessun negozio disponibile (TUTTE FUNZIONI NON PRESENTI)"
+
+# Modalità di assegnazione: greedy nell'ordine del file oppure ottima globale
+MODALITA = ('greedy', 'ottima')
+
+# Da incrementare a ogni modifica che cambia i risultati a parità di file e
+# parametri (punteggi, criteri di parità, riassegnazione): invalida i run archiviati
+VERSIONE_ALGORITMO = 1
+
+COLONNE_RISULTATI = [
+    "ID_PRELIEVO", "Negozio Assegnato", "Punteggio", "Percentuale Stock",
+    "Media Ponderata Combinata", "Media Ponderata", "Media Avanzamenti",
+    "Funzioni presenti", "Valore Totale",
+]
+COLONNE_PUNTEGGIO = [
+    'Negozio Assegnato', 'Punteggio', 'Percentuale Stock',
+    'Media Ponderata Combinata', 'Media Ponderata', 'Media Avanzamenti',
+]
+
+
+@dataclass
+class ParametriAssegnazione:
+    """Parametri dell'algoritmo, con gli stessi default della sidebar."""
+
+    I1: int = 70
+    alpha: float = 0.7
+    soglia_delivered: float = 100000.0
+    soglia_massima_moltiplicatore: float = 2.0
+    modalita: str = 'greedy'
+    workers: int = 1
+
+    @property
+    def I2(self):
+        return 100 - self.I1
+
+    def valida(self):
+        if not (0 <= self.I1 <= 100) or self.I1 + self.I2 != 100:
+            raise ValueError("I1 + I2 deve essere uguale a 100.")
+        if not (0 <= self.alpha <= 1):
+            raise ValueError("Alpha deve essere un valore compreso tra 0 e 1.")
+        if self.modalita not in MODALITA:
+            raise ValueError(f"Modalità di assegnazione non valida: {self.modalita!r} (ammesse: {', '.join(MODALITA)}).")
+        if self.workers < 1:
+            raise ValueError("Il numero di processi deve essere almeno 1.")
+
+
+def aggiungi_valore_totale(df_prelievi):
+    """Copia di `df_prelievi` con la colonna 'Valore Totale' (somma delle funzioni)."""
+    df_prelievi = df_prelievi.drop(columns=['Valore Totale'], errors='ignore')
+    df_prelievi['Valore Totale'] = df_prelievi.drop(columns=['ID_PRELIEVO']).sum(axis=1)
+    return df_prelievi
+
+
+def calcola_soglia_massima(df_prelievi, moltiplicatore):
+    """Restituisce (soglia_massima, valore massimo di un pallet)."""
+    max_pallet_valore = df_prelievi['Valore Totale'].max()
+    return max_pallet_valore * moltiplicatore, max_pallet_valore
+
+
+def normalizza_id_prelievo(id_prelievo):
+    return str(id_prelievo).split('.')[0] if '.' in str(id_prelievo) else str(id_prelievo)
+
+
+def pallet_da_prelievi(df_prelievi):
+    """Genera (id_prelievo, codici_funzione, valore_totale) nell'ordine del file.
+
+    I codici funzione sono le colonne con quantità > 0; `df_prelievi` deve
+    contenere già la colonna 'Valore Totale'.
+    """
+    colonne_funzione = [col for col in df_prelievi.columns if col != 'ID_PRELIEVO' and col != "Valore Totale"]
+    quantita = df_prelievi[colonne_funzione].to_numpy(dtype=float)
+    id_prelievi = df_prelievi['ID_PRELIEVO'].tolist()
+    valori_totali = df_prelievi['Valore Totale'].tolist()
+    for idx in range(len(id_prelievi)):
+        yield id_prelievi[idx], [colonne_funzione[j] for j in np.flatnonzero(quantita[idx] > 0)], valori_totali[idx]
+
+
+def separa_funzioni_presenti(modello, codici_funzione):
+    """Restituisce (codici presenti nella tabella ST, codici non presenti)."""
+    presenti = []
+    funzioni_non_presenti = []
+    for codice in codici_funzione:
+        (funzioni_non_presenti if modello.posizione_funzione(codice) is None else presenti).append(codice)
+    return presenti, funzioni_non_presenti
+
+
+def codici_da_risultato(funzioni_presenti):
+    """Codici della colonna 'Funzioni presenti', convertiti in int come nella riassegnazione."""
+    return [int(codice) for codice in funzioni_presenti.split(',') if codice.strip().isdigit()]
+
+
+def insiemi_funzioni(modello, df_prelievi):
+    """Insiemi di funzioni distinti che i due passaggi chiederanno alla cache.
+
+    Per ogni pallet: i codici presenti nella tabella ST e gli stessi codici
+    riletti dalla colonna 'Funzioni presenti', come fa la riassegnazione.
+    """
+    insiemi = {}
+    for _, codici_funzione, _ in pallet_da_prelievi(df_prelievi):
+        codici_funzione, _ = separa_funzioni_presenti(modello, codici_funzione)
+        if codici_funzione:
+            insiemi[tuple(codici_funzione)] = None
+            insiemi[tuple(codici_da_risultato(",".join(map(str, codici_funzione))))] = None
+    return list(insiemi)
+
+
+def crea_df_risultati(results):
+    df_results = pd.DataFrame(results, columns=COLONNE_RISULTATI)
+    df_results['ID_PRELIEVO'] = df_results['ID_PRELIEVO'].apply(normalizza_id_prelievo)
+    return df_results
+
+
+def scegli_migliore(punteggio, ammessi):
+    """Indice del candidato ammesso con punteggio massimo, None se nessuno.
+
+    A parità di punteggio vince il primo candidato, come con l'ordinamento
+    stabile decrescente dell'algoritmo originale.
+    """
+    indici = np.flatnonzero(ammessi)
+    if len(indici) == 0:
+        return None
+    return int(indici[np.argmax(punteggio[indici])])
+
+
+def notifica_avanzamento(progresso, fase, completati, totale):
+    if progresso is not None:
+        progresso(fase, completati, totale)
+
+
+def assegnazione_principale(modello, pallet, negozi_validi, cache, progresso=None, totale=None, risultati=None):
+    """Primo passaggio: un pallet per negozio, nell'ordine del file PRELIEVI.
+
+    `pallet` è un iterabile di (id_prelievo, codici_funzione, valore_totale),
+    da `pallet_da_prelievi` o `ingestione.FlussoPrelievi.pallet`, consumato
+    un pallet alla volta; `totale` è il numero di pallet, se noto, per
+    l'avanzamento. `cache` è la `CachePunteggi` dei negozi validi. Le righe
+    dei risultati vengono aggiunte a `risultati`, se indicata, man mano che
+    i pallet sono assegnati.
+    Restituisce (df_results, valori_assegnati) con il valore assegnato
+    per posizione negozio del modello.
+    """
+    results = [] if risultati is None else risultati
+    # Maschera dei negozi validi ancora liberi e valore assegnato per negozio
+    disponibili = np.zeros(len(modello.negozi), dtype=bool)
+    disponibili[negozi_validi] = True
+    valori_assegnati = np.zeros(len(modello.negozi))
+    notifica_avanzamento(progresso, 'assegnazione', 0, totale)
+
+    for idx, (id_prelievo, codici_funzione, valore_totale) in enumerate(pallet):
+        # Controlla funzioni non presenti nella tabella ST
+        codici_funzione, funzioni_non_presenti = separa_funzioni_presenti(modello, codici_funzione)
+        if not codici_funzione:  # Tutte le funzioni sono mancanti
+            results.append([str(id_prelievo), NESSUN_NEGOZIO_FUNZIONI, 0, 0, 0, 0, 0, ",".join(map(str, funzioni_non_presenti)), valore_totale])
+            notifica_avanzamento(progresso, 'assegnazione', idx + 1, totale)
+            continue  # Passa al prossimo pallet
+
+        # Negozi con "Total Delivered" > 0 per tutte le funzioni, ancora liberi
+        candidati, punteggi = cache.punteggi(codici_funzione)
+        migliore = scegli_migliore(punteggi[0], disponibili[candidati])
+        if migliore is not None:
+            posizione = candidati[migliore]
+            punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti = (valori[migliore] for valori in punteggi)
+            valori_assegnati[posizione] += valore_totale
+            disponibili[posizione] = False
+            results.append([str(id_prelievo), modello.negozi[posizione], punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti, ",".join(map(str, codici_funzione)), valore_totale])
+        else:
+            results.append([str(id_prelievo), NESSUN_NEGOZIO, 0, 0, 0, 0, 0, ",".join(map(str, codici_funzione)), valore_totale])
+        notifica_avanzamento(progresso, 'assegnazione', idx + 1, totale)
+
+    return crea_df_risultati(results), valori_assegnati
+
+
+def scrivi_aggiornamenti(df_results, righe, valori):
+    """Scrive in blocco le colonne di punteggio sulle righe (posizionali) indicate.
+
+    `valori` contiene una lista per ciascuna colonna di COLONNE_PUNTEGGIO.
+    """
+    if len(righe) == 0:
+        return df_results
+    for colonna, valori_colonna in zip(COLONNE_PUNTEGGIO, valori):
+        df_results.iloc[righe, df_results.columns.get_loc(colonna)] = valori_colonna
+    return df_results
+
+
+def riassegna_pallet_mancanti(modello, df_results, negozi_validi, valori_assegnati, soglia_massima, cache, progresso=None):
+    """Riassegna i pallet rimasti senza negozio rispettando la soglia massima.
+
+    Ogni negozio può ricevere al più un pallet in questo passaggio.
+    `valori_assegnati` è l'array del valore già assegnato per posizione
+    negozio; i punteggi vengono dalla `cache` del primo passaggio. Gli
+    aggiornamenti sono raccolti e scritti in `df_results` con un'unica
+    scrittura posizionale alla fine.
+    """
+    righe_mancanti = np.flatnonzero((df_results["Negozio Assegnato"] == NESSUN_NEGOZIO).to_numpy())
+    funzioni_presenti = df_results["Funzioni presenti"].to_numpy()[righe_mancanti]
+    valori_totali = df_results["Valore Totale"].to_numpy()[righe_mancanti]
+    # Negozi validi che non hanno ancora ricevuto un pallet in questo passaggio
+    liberi_nella_riassegnazione = np.zeros(len(modello.negozi), dtype=bool)
+    liberi_nella_riassegnazione[negozi_validi] = True
+    righe_aggiornate = []
+    aggiornamenti = [[] for _ in COLONNE_PUNTEGGIO]
+    totale = len(righe_mancanti)
+    notifica_avanzamento(progresso, 'riassegnazione', 0, totale)
+
+    for idx in range(totale):
+        valore_totale = valori_totali[idx]
+        codici_funzione = codici_da_risultato(funzioni_presenti[idx])
+
+        # Candidati eleggibili, liberi in questo passaggio ed entro la soglia massima
+        candidati, punteggi = cache.punteggi(codici_funzione)
+        ammessi = liberi_nella_riassegnazione[candidati] & (valori_assegnati[candidati] + valore_totale <= soglia_massima)
+        migliore = scegli_migliore(punteggi[0], ammessi)
+        if migliore is not None:
+            posizione = candidati[migliore]
+            righe_aggiornate.append(righe_mancanti[idx])
+            aggiornamenti[0].append(modello.negozi[posizione])
+            for colonna, valori in zip(aggiornamenti[1:], punteggi):
+                colonna.append(valori[migliore])
+            valori_assegnati[posizione] += valore_totale
+            liberi_nella_riassegnazione[posizione] = False
+        notifica_avanzamento(progresso, 'riassegnazione', idx + 1, totale)
+
+    return scrivi_aggiornamenti(df_results, righe_aggiornate, aggiornamenti)
+
+
+def _prepara_punteggi(st_df, avanzamenti_df, stock_df, params, modello, componenti):
+    """Valida i parametri e restituisce (modello, negozi_validi, cache dei punteggi)."""
+    params.valida()
+    if modello is None:
+        with fase('modello dati', righe=len(st_df)):
+            modello = ModelloDati(st_df, avanzamenti_df, stock_df)
+    with fase('negozi validi', righe=len(modello.negozi)):
+        negozi_validi = modello.negozi_validi(params.soglia_delivered)
+    cache = CachePunteggi(modello, negozi_validi, params.I1, params.I2, params.alpha, componenti)
+    return modello, negozi_validi, cache
+
+
+def _esegui_passaggi(modello, pallet, negozi_validi, cache, params, progresso, totale, risultati=None):
+    """Primo passaggio e riassegnazione automatica sui pallet di `pallet`."""
+    if params.modalita == 'ottima':
+        from assegnazione_ottima import assegnazione_ottima, riassegnazione_ottima
+        primo_passaggio, riassegnazione = assegnazione_ottima, riassegnazione_ottima
+    else:
+        primo_passaggio, riassegnazione = assegnazione_principale, riassegna_pallet_mancanti
+
+    with fase('assegnazione') as misura:
+        df_results, valori_assegnati = primo_passaggio(modello, pallet, negozi_validi, cache, progresso, totale, risultati)
+        misura.righe = len(df_results)
+
+    # RIASSEGNAZIONE AUTOMATICA DEI PALLET MANCANTI
+    mancanti = int((df_results["Negozio Assegnato"] == NESSUN_NEGOZIO).sum())
+    if mancanti:
+        # Ogni pallet ha una riga nei risultati con il suo Valore Totale
+        soglia_massima, _ = calcola_soglia_massima(df_results, params.soglia_massima_moltiplicatore)
+        with fase('riassegnazione', righe=mancanti):
+            df_results = riassegnazione(modello, df_results, negozi_validi, valori_assegnati, soglia_massima, cache, progresso)
+
+    return df_results
+
+
+def assign_pallets(st_df, avanzamenti_df, prelievi_df, stock_df, params, progresso=None, modello=None, componenti=None,
+                   risultati=None):
+    """Esegue assegnazione e riassegnazione automatica dei pallet.
+
+    Le tabelle sono quelle normalizzate da `ingestione.carica_tabelle`.
+    `progresso`, se indicato, viene chiamato come
+    `progresso(fase, completati, totale)` con fase 'assegnazione' o
+    'riassegnazione'. Un `ModelloDati` già costruito sulle stesse tabelle
+    può essere passato in `modello`, e una `CacheComponenti` dello stesso
+    modello in `componenti` per ricalcolare solo il punteggio P quando
+    cambiano i parametri. Le righe del primo passaggio vengono aggiunte a
+    `risultati`, se indicata, man mano che i pallet sono assegnati.
+    Restituisce il DataFrame dei risultati.
+    """
+    modello, negozi_validi, cache = _prepara_punteggi(st_df, avanzamenti_df, stock_df, params, modello, componenti)
+    df_prelievi = aggiungi_valore_totale(prelievi_df)
+    if params.workers > 1:
+        # Punteggi (o componenti mancanti) calcolati in parallelo, poi consumati in ordine dai passaggi
+        with fase('punteggi paralleli') as misura:
+            insiemi = insiemi_funzioni(modello, df_prelievi)
+            misura.righe = len(insiemi)
+            precalcola_punteggi(cache, insiemi, params.workers)
+    return _esegui_passaggi(modello, pallet_da_prelievi(df_prelievi), negozi_validi, cache, params, progresso, len(df_prelievi),
+                            risultati)
+
+
+def assegna_pallet_in_streaming(st_df, avanzamenti_df, stock_df, pallet, params, progresso=None, modello=None,
+                                componenti=None, totale=None, risultati=None):
+    """Come `assign_pallets`, con i pallet letti man mano da un iterabile.
+
+    `pallet` genera (id_prelievo, codici_funzione, valore_totale) nell'ordine
+    del file, ad esempio `ingestione.FlussoPrelievi.pallet()`: il primo
+    passaggio assegna ogni pallet appena letto, senza il DataFrame PRELIEVI
+    completo, e le righe sono disponibili in `risultati` se indicata.
+    `totale` è il numero di pallet per l'avanzamento, se noto. Il calcolo
+    parallelo dei punteggi non è usato, perché richiede gli insiemi di
+    funzioni di tutti i pallet in anticipo.
+    """
+    modello, negozi_validi, cache = _prepara_punteggi(st_df, avanzamenti_df, stock_df, params, modello, componenti)
+    return _esegui_passaggi(modello, pallet, negozi_validi, cache, params, progresso, totale, risultati)
+
+
+def riepilogo_risultati(df_results):
+    """Punteggio totale e tasso di assegnazione di un DataFrame dei risultati.
+
+    I pallet assegnati sono contati come nelle metriche dell'app e nel
+    riepilogo della CLI: tutti tranne quelli senza negozio disponibile. I
+    pallet con tutte le funzioni assenti dalla tabella ST sono quindi
+    compresi e vengono riportati anche a parte.
+    """
+    totale = len(df_results)
+    negozi = df_results["Negozio Assegnato"]
+    assegnati = totale - int((negozi == NESSUN_NEGOZIO).sum())
+    return {
+        'Pallet': totale,
+        'Pallet assegnati': assegnati,
+        'Pallet senza funzioni in ST': int((negozi == NESSUN_NEGOZIO_FUNZIONI).sum()),
+        'Tasso di assegnazione (%)': assegnati / totale * 100 if totale > 0 else 0,
+        'Punteggio totale': float(df_results['Punteggio'].sum()),
+    }
+
+
+def confronta_modalita(st_df, avanzamenti_df, prelievi_df, stock_df, params, modello=None, componenti=None):
+    """Esegue l'assegnazione in tutte le modalità e ne confronta i risultati.
+
+    Restituisce (DataFrame di confronto con una colonna per modalità,
+    dizionario modalità → DataFrame dei risultati).
+    """
+    if modello is None:
+        modello = ModelloDati(st_df, avanzamenti_df, stock_df)
+    riepiloghi = {}
+    risultati = {}
+    for modalita in MODALITA:
+        inizio = time.perf_counter()
+        risultati[modalita] = assign_pallets(
+            st_df, avanzamenti_df, prelievi_df, stock_df, replace(params, modalita=modalita),
+            modello=modello, componenti=componenti
+        )
+        riepiloghi[modalita] = riepilogo_risultati(risultati[modalita])
+        riepiloghi[modalita]['Tempo (s)'] = time.perf_counter() - inizio
+    return pd.DataFrame(riepiloghi), risultati
+
+
+def confronta_scenari(st_df, avanzamenti_df, prelievi_df, stock_df, scenari, modello=None, componenti=None):
+    """Esegue l'assegnazione per più insiemi di parametri e ne confronta i risultati.
+
+    `scenari` è un dizionario nome → `ParametriAssegnazione`. Le componenti
+    del punteggio vengono calcolate una sola volta (o riprese da
+    `componenti`) e condivise da tutti gli scenari; gli scenari con gli
+    stessi I1 e alpha condividono anche i punteggi combinati.
+    Restituisce (DataFrame di confronto con una colonna per scenario,
+    dizionario nome → DataFrame dei risultati).
+    """
+    if modello is None:
+        modello = ModelloDati(st_df, avanzamenti_df, stock_df)
+    if componenti is None:
+        componenti = CacheComponenti(modello)
+    riepiloghi = {}
+    risultati = {}
+    for nome, params in scenari.items():
+        inizio = time.perf_counter()
+        risultati[nome] = assign_pallets(
+            st_df, avanzamenti_df, prelievi_df, stock_df, params, modello=modello, componenti=componenti
+        )
+        riepiloghi[nome] = {
+            'I1': params.I1,
+            'Alpha': params.alpha,
+            'Soglia delivered': params.soglia_delivered,
+            'Moltiplicatore soglia massima': params.soglia_massima_moltiplicatore,
+            **riepilogo_risultati(risultati[nome]),
+            'Tempo (s)': time.perf_counter() - inizio,
+        }
+    return pd.DataFrame(riepiloghi), risultati
+
+
+def misura_speedup(st_df, avanzamenti_df, prelievi_df, stock_df, params, workers=(1, 2, 4, 8)):
+    """Tempo di assegnazione e speedup rispetto al primo numero di processi indicato.
+
+    Verifica anche che i risultati coincidano con quelli del primo run.
+    """
+    modello = ModelloDati(st_df, avanzamenti_df, stock_df)
+    righe = []
+    riferimento = None
+    for n in workers:
+        inizio = time.perf_counter()
+        df_results = assign_pallets(st_df, avanzamenti_df, prelievi_df, stock_df, replace(params, workers=n), modello=modello)
+        tempo = time.perf_counter() - inizio
+        if riferimento is None:
+            riferimento = (df_results, tempo)
+        righe.append({
+            'Processi': n,
+            'Tempo (s)': tempo,
+            'Speedup': riferimento[1] / tempo if tempo > 0 else np.nan,
+            'Risultati identici': df_results.equals(riferimento[0]),
+        })
+    return pd.DataFrame(righe)
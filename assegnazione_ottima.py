@@ -0,0 +1,131 @@
+"""Modalità di assegnazione ottima (problema di assegnazione globale).
+
+Invece di scorrere i pallet nell'ordine del file, la matrice pallet ×
+negozio dei punteggi P viene costruita una sola volta e risolta con
+l'algoritmo ungherese (`scipy.optimize.linear_sum_assignment`),
+massimizzando il punteggio totale con al più un pallet per negozio. Le
+coppie non ammesse (negozio con Total Delivered ≤ 0 per una funzione
+richiesta) sono escluse.
+
+Anche la riassegnazione dei pallet rimasti è risolta globalmente: ogni
+negozio riceve al più un altro pallet e solo se il valore assegnato resta
+entro la soglia massima.
+"""
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from assegnazione import (
+    COLONNE_PUNTEGGIO,
+    NESSUN_NEGOZIO,
+    NESSUN_NEGOZIO_FUNZIONI,
+    codici_da_risultato,
+    crea_df_risultati,
+    notifica_avanzamento,
+    scrivi_aggiornamenti,
+    separa_funzioni_presenti,
+)
+
+# Piccolo premio per coppia ammessa: a parità di punteggio totale
+# preferisce assegnare un pallet piuttosto che lasciarlo senza negozio.
+BONUS_ASSEGNAZIONE = 1e-9
+
+
+def matrice_punteggi(cache, insiemi_codici, progresso=None, fase='assegnazione'):
+    """Punteggio P per ogni insieme di funzioni × negozio valido della `cache`.
+
+    Restituisce una matrice (len(insiemi_codici), len(negozi validi)) con
+    NaN per le coppie non ammesse.
+    """
+    negozi_validi = cache.negozi_validi
+    punteggi = np.full((len(insiemi_codici), len(negozi_validi)), np.nan)
+    notifica_avanzamento(progresso, fase, 0, len(insiemi_codici))
+    for r, codici_funzione in enumerate(insiemi_codici):
+        candidati, valori = cache.punteggi(list(codici_funzione))
+        punteggi[r, np.searchsorted(negozi_validi, candidati)] = valori[0]
+        notifica_avanzamento(progresso, fase, r + 1, len(insiemi_codici))
+    return punteggi
+
+
+def risolvi_assegnazione(punteggi, ammessi):
+    """Risolve l'assegnazione di massimo punteggio tra righe e colonne.
+
+    Restituisce le coppie (righe, colonne) assegnate, tutte ammesse.
+    """
+    if punteggi.size == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    costo = np.where(ammessi, -(np.nan_to_num(punteggi) + BONUS_ASSEGNAZIONE), 0.0)
+    righe, colonne = linear_sum_assignment(costo)
+    tenute = ammessi[righe, colonne]
+    return righe[tenute], colonne[tenute]
+
+
+def _indicizza_insiemi(lista_codici):
+    """Raggruppa i pallet con lo stesso insieme di funzioni.
+
+    Restituisce (insiemi distinti, indice dell'insieme per ogni pallet).
+    """
+    posizioni = {}
+    indice = [posizioni.setdefault(tuple(codici), len(posizioni)) for codici in lista_codici]
+    return list(posizioni), np.array(indice, dtype=int)
+
+
+def _valori_coppia(cache, codici_funzione, posizione):
+    """Negozio e valori di punteggio per la coppia (insieme di funzioni, negozio)."""
+    candidati, punteggi = cache.punteggi(codici_funzione)
+    k = np.searchsorted(candidati, posizione)
+    return [cache.modello.negozi[posizione]] + [valori[k] for valori in punteggi]
+
+
+def assegnazione_ottima(modello, pallet, negozi_validi, cache, progresso=None, totale=None, risultati=None):
+    """Primo passaggio ottimo: un pallet per negozio, massimo punteggio totale.
+
+    Stessa interfaccia di `assegnazione.assegnazione_principale`; tutti i
+    pallet vengono letti prima di risolvere l'assegnazione, quindi le righe
+    in `risultati` restano senza negozio fino alla fine del passaggio.
+    """
+    results = [] if risultati is None else risultati
+    da_assegnare = []  # (indice in results, codici_funzione)
+    for id_prelievo, codici_funzione, valore_totale in pallet:
+        codici_funzione, funzioni_non_presenti = separa_funzioni_presenti(modello, codici_funzione)
+        if not codici_funzione:  # Tutte le funzioni sono mancanti
+            results.append([str(id_prelievo), NESSUN_NEGOZIO_FUNZIONI, 0, 0, 0, 0, 0, ",".join(map(str, funzioni_non_presenti)), valore_totale])
+            continue
+        da_assegnare.append((len(results), codici_funzione))
+        results.append([str(id_prelievo), NESSUN_NEGOZIO, 0, 0, 0, 0, 0, ",".join(map(str, codici_funzione)), valore_totale])
+
+    insiemi, indice_insieme = _indicizza_insiemi([codici for _, codici in da_assegnare])
+    punteggi = matrice_punteggi(cache, insiemi, progresso)[indice_insieme]
+    righe, colonne = risolvi_assegnazione(punteggi, ~np.isnan(punteggi))
+
+    valori_assegnati = np.zeros(len(modello.negozi))
+    for r, c in zip(righe, colonne):
+        posizione_risultato, codici_funzione = da_assegnare[r]
+        posizione = negozi_validi[c]
+        riga = results[posizione_risultato]
+        riga[1:7] = _valori_coppia(cache, codici_funzione, posizione)
+        valori_assegnati[posizione] += riga[8]
+    return crea_df_risultati(results), valori_assegnati
+
+
+def riassegnazione_ottima(modello, df_results, negozi_validi, valori_assegnati, soglia_massima, cache, progresso=None):
+    """Riassegnazione globale dei pallet rimasti, con vincolo di soglia massima.
+
+    Stessa interfaccia di `assegnazione.riassegna_pallet_mancanti`.
+    """
+    righe_mancanti = np.flatnonzero((df_results["Negozio Assegnato"] == NESSUN_NEGOZIO).to_numpy())
+    codici = [codici_da_risultato(f) for f in df_results["Funzioni presenti"].to_numpy()[righe_mancanti]]
+    valori_totali = df_results["Valore Totale"].to_numpy(dtype=float)[righe_mancanti]
+
+    insiemi, indice_insieme = _indicizza_insiemi(codici)
+    punteggi = matrice_punteggi(cache, insiemi, progresso, fase='riassegnazione')[indice_insieme]
+    # Coppia ammessa solo se il negozio resta entro la soglia massima
+    entro_soglia = valori_assegnati[negozi_validi][None, :] + valori_totali[:, None] <= soglia_massima
+    righe, colonne = risolvi_assegnazione(punteggi, ~np.isnan(punteggi) & entro_soglia)
+
+    aggiornamenti = [[] for _ in COLONNE_PUNTEGGIO]
+    for r, c in zip(righe, colonne):
+        posizione = negozi_validi[c]
+        for colonna, valore in zip(aggiornamenti, _valori_coppia(cache, codici[r], posizione)):
+            colonna.append(valore)
+        valori_assegnati[posizione] += valori_totali[r]
+    return scrivi_aggiornamenti(df_results, righe_mancanti[righe], aggiornamenti)
@@ -1,10 +1,31 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from io import BytesIO
 import warnings
+import os
+
+from archivio import CARTELLA_PREDEFINITA, ArchivioRun, chiave_run
+from assegnazione import (
+    ParametriAssegnazione,
+    aggiungi_valore_totale,
+    calcola_soglia_massima,
+    confronta_scenari
+)
+from esportazione import FORMATI, EsportazioneRisultati
+from ingestione import CacheIngestione
+from lavori import ANNULLATO, COMPLETATO, ERRORE, LavoroAssegnazione
+from modello_dati import ModelloDati
+from punteggi import CacheComponenti
+from strumentazione import configura_log, fase, registra_prestazioni
+
 warnings.filterwarnings('ignore')
 
+# Righe di log JSON delle prestazioni sullo stderr del server
+configura_log()
+
+# Secondi tra due aggiornamenti della pagina mentre l'assegnazione è in corso
+INTERVALLO_AGGIORNAMENTO = 1.0
+
 # Page configuration
 st.set_page_config(
     page_title="Pallet Assignment System",
@@ -15,11 +36,43 @@ st.set_page_config(
 st.title("📦 Sistema di Assegnazione Pallet (un pallet per negozio con eventuale riassegnazione dei pallet mancanti)")
 st.markdown("---")
 
+# Cache delle tabelle normalizzate, condivisa tra rerun e sessioni
+@st.cache_resource
+def ottieni_cache_ingestione():
+    return CacheIngestione(max_voci=4)
+
+# Archivio su disco dei run, condiviso tra sessioni e riavvii del server (cartella in ARCHIVIO_RUN)
+@st.cache_resource
+def ottieni_archivio():
+    return ArchivioRun(os.environ.get('ARCHIVIO_RUN', CARTELLA_PREDEFINITA))
+
 # Initialize session state
 if 'df_results' not in st.session_state:
     st.session_state.df_results = None
 if 'processing_complete' not in st.session_state:
     st.session_state.processing_complete = False
+if 'versione_risultati' not in st.session_state:
+    st.session_state.versione_risultati = 0
+    st.session_state.esportazione = None
+if 'chiave_modello' not in st.session_state:
+    st.session_state.chiave_modello = None
+    st.session_state.modello_dati = None
+    st.session_state.componenti_punteggio = None
+if 'prestazioni' not in st.session_state:
+    st.session_state.prestazioni = None
+    st.session_state.prestazioni_caricamento = None
+if 'lavori' not in st.session_state:
+    # Lavori di assegnazione in background per ID; id_risultati è il lavoro già salvato in df_results
+    st.session_state.lavori = {}
+    st.session_state.id_lavoro = None
+    st.session_state.id_risultati = None
+if 'run_archiviato' not in st.session_state:
+    # Info del run ripreso dall'archivio, se df_results viene da lì
+    st.session_state.run_archiviato = None
+
+# L'assegnazione gira in un thread: il lavoro resta in session state tra i rerun
+lavoro = st.session_state.lavori.get(st.session_state.id_lavoro)
+lavoro_in_corso = lavoro is not None and lavoro.in_corso
 
 # Sidebar for file uploads
 st.sidebar.header("📁 Caricamento File")
@@ -90,6 +143,197 @@ soglia_massima_moltiplicatore = st.sidebar.slider(
     help="Il valore massimo assegnabile per negozio sarà: valore_max_pallet * questo moltiplicatore"
 )
 
+# Modalità di assegnazione
+ETICHETTE_MODALITA = {
+    'greedy': "Greedy (ordine del file PRELIEVI)",
+    'ottima': "Ottima (assegnazione globale)"
+}
+modalita = st.sidebar.selectbox(
+    "Modalità di assegnazione",
+    options=list(ETICHETTE_MODALITA),
+    format_func=ETICHETTE_MODALITA.get,
+    help="Greedy: ogni pallet prende il miglior negozio libero nell'ordine del file. "
+         "Ottima: massimizza il punteggio totale su tutti i pallet insieme."
+)
+
+confronta = st.sidebar.checkbox(
+    "Confronta le modalità",
+    value=False,
+    help="Esegue anche l'altra modalità e mostra punteggio totale e tasso di assegnazione affiancati"
+)
+
+workers = st.sidebar.number_input(
+    "Processi per il calcolo dei punteggi",
+    min_value=1,
+    max_value=max(1, os.cpu_count() or 1),
+    value=1,
+    step=1,
+    help="Con più di un processo i punteggi vengono calcolati in parallelo; il risultato non cambia"
+)
+
+profila = st.sidebar.checkbox(
+    "Profilazione (cProfile)",
+    value=False,
+    help="Registra un report cProfile dell'assegnazione, scaricabile dal pannello Performance"
+)
+
+def descrivi_run(info):
+    parametri = info['parametri']
+    return (
+        f"{info['creato'].replace('T', ' ')} · {ETICHETTE_MODALITA[parametri['modalita']]}, "
+        f"I1={parametri['I1']}, α={parametri['alpha']}, soglia {parametri['soglia_delivered']:g}, "
+        f"molt. {parametri['soglia_massima_moltiplicatore']:g} · {info['riepilogo']['Pallet']} pallet"
+    )
+
+def imposta_risultati(df_results, df_confronto, prestazioni):
+    """Salva in session state i risultati da mostrare, come nuova versione."""
+    st.session_state.df_results = df_results
+    st.session_state.processing_complete = True
+    st.session_state.versione_risultati += 1
+    st.session_state.esportazione = EsportazioneRisultati(df_results, st.session_state.versione_risultati)
+    st.session_state.prestazioni = prestazioni
+    if df_confronto is not None:
+        df_confronto = df_confronto.copy()
+        df_confronto.columns = [ETICHETTE_MODALITA[m] for m in df_confronto.columns]
+    st.session_state.df_confronto = df_confronto
+
+def apri_run_archiviato(run):
+    info, df_results, df_confronto = run
+    imposta_risultati(df_results, df_confronto, None)
+    st.session_state.run_archiviato = info
+    # I risultati mostrati non sono più quelli di un lavoro
+    st.session_state.lavori = {}
+    st.session_state.id_lavoro = None
+    st.session_state.id_risultati = None
+
+# Run salvati nell'archivio, riapribili senza ricaricare i file né ricalcolare
+st.sidebar.header("📂 Run salvati")
+archivio = ottieni_archivio()
+run_salvati = archivio.elenco_run()
+if run_salvati:
+    indice_run = st.sidebar.selectbox(
+        "Run",
+        options=range(len(run_salvati)),
+        format_func=lambda i: descrivi_run(run_salvati[i]),
+        help="Risultati salvati su disco dei run già eseguiti, dal più recente"
+    )
+    if st.sidebar.button("📂 Apri run salvato", use_container_width=True, disabled=lavoro_in_corso):
+        run = archivio.carica_run(run_salvati[indice_run]['chiave'])
+        if run is None:
+            st.sidebar.error("Il run non è più presente nell'archivio")
+        else:
+            apri_run_archiviato(run)
+            lavoro = None
+    statistiche_archivio = archivio.statistiche()
+    st.sidebar.caption(f"Archivio: {statistiche_archivio['run']} run, {statistiche_archivio['dimensione_mb']:.1f} MB")
+else:
+    st.sidebar.caption("Nessun run salvato")
+
+# Etichette delle fasi notificate dal lavoro in background
+ETICHETTE_FASI = {
+    'assegnazione': "Assegnazione",
+    'riassegnazione': "🔄 Riassegnazione automatica dei pallet mancanti",
+    'confronto': "⚖️ Confronto tra modalità"
+}
+
+# Avanzamento del lavoro in corso: si aggiorna da solo senza rieseguire l'intero script
+@st.fragment(run_every=INTERVALLO_AGGIORNAMENTO)
+def mostra_avanzamento(lavoro):
+    if not lavoro.in_corso:
+        # Lavoro terminato: rerun completo per mostrare i risultati
+        st.rerun()
+    
+    fase_lavoro, completati, totale = lavoro.avanzamento
+    etichetta = ETICHETTE_FASI.get(fase_lavoro, "Preparazione")
+    if totale:
+        st.progress(completati / totale, text=f"{etichetta}: {completati}/{totale} ({lavoro.durata():.0f} s)")
+    else:
+        st.progress(0, text=f"{etichetta} in corso... ({lavoro.durata():.0f} s)")
+    
+    if lavoro.annullamento_richiesto:
+        st.caption("Annullamento in corso...")
+    elif st.button("⛔ Annulla assegnazione", key=f"annulla_{lavoro.id}"):
+        lavoro.annulla()
+        st.caption("Annullamento in corso...")
+    
+    if st.toggle("Mostra risultati parziali", key=f"parziali_{lavoro.id}"):
+        parziali = lavoro.risultati_parziali()
+        st.caption(f"{len(parziali)} pallet elaborati dal primo passaggio")
+        st.dataframe(parziali, use_container_width=True)
+
+# Risultati in session state: metriche, tabelle, download e controlli finali
+def mostra_risultati():
+    # Summary metrics - ESATTO COME ORIGINALE
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        total_pallets = len(st.session_state.df_results)
+        st.metric("Totale Pallet", total_pallets)
+    
+    with col2:
+        # ESATTO COME ORIGINALE - conta i pallet NON assegnati e sottrae dal totale
+        pallet_non_assegnati = st.session_state.df_results[st.session_state.df_results["Negozio Assegnato"] == "Nessun negozio disponibile"]
+        assigned_pallets = total_pallets - len(pallet_non_assegnati)
+        st.metric("Pallet Assegnati", assigned_pallets)
+    
+    with col3:
+        unassigned_pallets = len(pallet_non_assegnati)
+        st.metric("Pallet Non Assegnati", unassigned_pallets)
+    
+    with col4:
+        assignment_rate = (assigned_pallets / total_pallets) * 100 if total_pallets > 0 else 0
+        st.metric("Tasso di Assegnazione", f"{assignment_rate:.1f}%")
+    
+    if st.session_state.get('df_confronto') is not None:
+        st.subheader("⚖️ Confronto tra modalità")
+        st.dataframe(st.session_state.df_confronto, use_container_width=True)
+    
+    # Results table
+    st.subheader("📋 Risultati Assegnazione")
+    st.dataframe(st.session_state.df_results, use_container_width=True)
+    
+    # Download buttons: i file vengono generati solo al click, una volta per versione dei risultati
+    esportazione = st.session_state.esportazione
+    for colonna, (formato, (nome_formato, mime)) in zip(st.columns(len(FORMATI)), FORMATI.items()):
+        with colonna:
+            st.download_button(
+                label=f"📥 Scarica Risultati ({nome_formato})",
+                data=esportazione.generatore(formato),
+                file_name=f"risultati_assegnazione.{formato}",
+                mime=mime,
+                on_click="ignore",
+                use_container_width=True
+            )
+    
+    # Final checks - ESATTO COME ORIGINALE
+    pallet_ancora_non_assegnati = st.session_state.df_results[st.session_state.df_results["Negozio Assegnato"] == "Nessun negozio disponibile"]
+    if not pallet_ancora_non_assegnati.empty:
+        st.warning("⚠️ Alcuni pallet rimangono ancora non assegnati dopo la riassegnazione automatica")
+        with st.expander("Visualizza pallet ancora non assegnati"):
+            st.dataframe(pallet_ancora_non_assegnati, use_container_width=True)
+    
+    pallet_senza_funzioni = st.session_state.df_results[st.session_state.df_results["Negozio Assegnato"] == "Nessun negozio disponibile (TUTTE FUNZIONI NON PRESENTI)"]
+    if not pallet_senza_funzioni.empty:
+        st.error("ATTENZIONE: ancora presenti pallet non assegnati (presenti pallet con tutte funzioni non presenti)")
+    
+    # Performance: tempi, chiamate e righe per fase della lettura file e dell'assegnazione
+    with st.expander("⏱️ Performance"):
+        if st.session_state.prestazioni_caricamento is not None:
+            st.caption("Lettura file")
+            st.dataframe(st.session_state.prestazioni_caricamento.tabella(), use_container_width=True)
+        # Assenti per i run ripresi dall'archivio
+        if st.session_state.prestazioni is not None:
+            st.caption("Assegnazione")
+            st.dataframe(st.session_state.prestazioni.tabella(), use_container_width=True)
+            if st.session_state.prestazioni.profilo is not None:
+                st.download_button(
+                    label="📥 Scarica report cProfile",
+                    data=st.session_state.prestazioni.profilo,
+                    file_name="profilo_assegnazione.txt",
+                    mime="text/plain",
+                    on_click="ignore"
+                )
+
 # Main content area
 if all([uploaded_st, uploaded_avanzamenti, uploaded_prelievi, uploaded_stock]):
     
@@ -97,60 +341,50 @@ if all([uploaded_st, uploaded_avanzamenti, uploaded_prelievi, uploaded_stock]):
     with st.spinner("Caricamento e processamento dei file..."):
         
         try:
-            # Pulizia e normalizzazione del DataFrame - ESATTO COME ORIGINALE
-            df = pd.read_excel(uploaded_st, header=0)
-            
-            # Supponiamo che la prima riga contenga i numeri da concatenare alle intestazioni
-            # Prendi la riga con i numeri sopra le colonne
-            numeri_colonne = df.iloc[0, 1::3].values  # I numeri sono nelle celle 2, 5, 8, ... (0-based index)
-            # Crea un elenco per le nuove intestazioni
-            nuove_intestazioni = ['Des Negozio']  # La prima colonna rimane invariata
-            # Aggiungi le intestazioni modificate con il numero
-            for i, numero in enumerate(numeri_colonne):
-                nuove_intestazioni.append(f"{numero} Somma di Total Delivered")
-                nuove_intestazioni.append(f"{numero} Somma di Total Sales")
-                nuove_intestazioni.append(f"{numero} Media di ST value")
-            # Sostituisci le intestazioni nel dataframe
-            df.columns = nuove_intestazioni
-            # Elimina la riga con i numeri
-            df = df.drop(index=0)
-            df = df.drop(index=1).reset_index(drop=True)
-            # Rimuovo eventuali righe con valori NaN nella colonna 'Des negozio'
-            df = df.dropna(subset=["Des Negozio"])
-            df = df.fillna(0)
-            
-            # Caricamento del file contenente gli AVANZAMENTI
-            df_avanzamenti = pd.read_excel(uploaded_avanzamenti)
-            df_avanzamenti = df_avanzamenti.fillna(0)
+            # Lettura e normalizzazione dei file, memorizzate per contenuto tra i rerun
+            cache_ingestione = ottieni_cache_ingestione()
+            with registra_prestazioni() as registro_caricamento:
+                chiave_input, (df, df_avanzamenti, df_prelievi, df_stock) = cache_ingestione.carica(
+                    uploaded_st.getvalue(),
+                    uploaded_avanzamenti.getvalue(),
+                    uploaded_prelievi.getvalue(),
+                    uploaded_stock.getvalue()
+                )
+                statistiche_cache = cache_ingestione.statistiche()
+                st.sidebar.caption(
+                    f"Cache file: {statistiche_cache['voci']} voci, {statistiche_cache['hit']} hit, "
+                    f"{statistiche_cache['miss']} miss, {statistiche_cache['evizioni']} evizioni"
+                )
             
-            # Trova i codici mancanti nel df_avanzamenti
-            codici_mancanti_AV = set(df['Des Negozio']) - set(df_avanzamenti['Des Negozio'])
-            # Aggiungi una riga per ciascun codice mancante
-            for codice in codici_mancanti_AV:
-                # Crea una nuova riga con il codice e valori a 0
-                nuova_riga_AV = pd.DataFrame({'Des Negozio': [codice], 'Valore': [0]})
-                df_avanzamenti = pd.concat([df_avanzamenti, nuova_riga_AV], ignore_index=True)
-            df_avanzamenti = df_avanzamenti.fillna(0)
-            
-            # Caricamento del file contenente i PRELIEVI
-            df_prelievi = pd.read_excel(uploaded_prelievi)
-            df_prelievi = df_prelievi.fillna(0)
-            
-            # Caricamento del file contenente lo STOCK
-            df_stock = pd.read_excel(uploaded_stock)
-            df_stock = df_stock.fillna(0)
-            
-            # Trova i codici mancanti nel df_stock
-            codici_mancanti = set(df['Des Negozio']) - set(df_stock['Des Negozio'])
-            # Aggiungi una riga per ciascun codice mancante
-            for codice in codici_mancanti:
-                # Crea una nuova riga con il codice e valori a 0
-                nuova_riga = pd.DataFrame({'Des Negozio': [codice], 'Valore': [0]})
-                df_stock = pd.concat([df_stock, nuova_riga], ignore_index=True)
-            df_stock = df_stock.fillna(0)
+                # Modello dati costruito una sola volta per ogni caricamento
+                if st.session_state.chiave_modello != chiave_input:
+                    with fase('modello dati', righe=len(df)):
+                        st.session_state.modello_dati = ModelloDati(df, df_avanzamenti, df_stock)
+                    st.session_state.componenti_punteggio = CacheComponenti(st.session_state.modello_dati)
+                    st.session_state.chiave_modello = chiave_input
+                    # Tabelle normalizzate salvate nell'archivio, per riaprire i run senza i file
+                    try:
+                        with fase('archivio ingresso', righe=len(df_prelievi)):
+                            archivio.salva_ingresso(
+                                chiave_input, (df, df_avanzamenti, df_prelievi, df_stock),
+                                file=[f.name for f in (uploaded_st, uploaded_avanzamenti, uploaded_prelievi, uploaded_stock)]
+                            )
+                    except Exception as e:
+                        st.sidebar.warning(f"Archivio non disponibile: {str(e)}")
+            # Misure conservate solo quando i file sono stati davvero letti
+            if registro_caricamento.misure:
+                st.session_state.prestazioni_caricamento = registro_caricamento
             
             st.success("✅ File caricati e processati con successo!")
             
+            negozi_aggiunti_av = df_avanzamenti.attrs.get('negozi_aggiunti', 0)
+            negozi_aggiunti_stock = df_stock.attrs.get('negozi_aggiunti', 0)
+            if negozi_aggiunti_av or negozi_aggiunti_stock:
+                st.info(
+                    f"Negozi della tabella ST aggiunti con valori a zero: "
+                    f"{negozi_aggiunti_av} in AVANZAMENTI, {negozi_aggiunti_stock} in STOCK"
+                )
+            
         except Exception as e:
             st.error(f"Errore nel processamento dei file: {str(e)}")
             st.stop()
@@ -167,269 +401,132 @@ if all([uploaded_st, uploaded_avanzamenti, uploaded_prelievi, uploaded_stock]):
         st.dataframe(df_prelievi.head(), use_container_width=True)
     
     # Process button
-    if st.button("🚀 Avvia Assegnazione Pallet", type="primary", use_container_width=True):
+    if st.button("🚀 Avvia Assegnazione Pallet", type="primary", use_container_width=True, disabled=lavoro_in_corso):
         
-        with st.spinner("Processamento in corso..."):
-            
-            # CODICE ORIGINALE ESATTO
-            df_negozi = df
-            
-            # Calcolo del valore totale per ogni riga in df_prelievi
-            df_prelievi['Valore Totale'] = df_prelievi.drop(columns=['ID_PRELIEVO']).sum(axis=1)
-            
-            if I1 + I2 != 100:
-                st.error("I1 + I2 deve essere uguale a 100.")
-                st.stop()
-                
-            if not (0 <= alpha <= 1):
-                st.error("Alpha deve essere un valore compreso tra 0 e 1.")
-                st.stop()
-            
-            negozi_disponibili = set(df_negozi['Des Negozio'])
-            
-            def calcola_totale_delivered(row):
-                return sum([row[col] for col in row.index if "Total Delivered" in col])
-            
-            negozi_validi = {
-                negozio: calcola_totale_delivered(df_negozi[df_negozi['Des Negozio'] == negozio].iloc[0])
-                for negozio in negozi_disponibili
-                if calcola_totale_delivered(df_negozi[df_negozi['Des Negozio'] == negozio].iloc[0]) >= soglia_delivered
-            }
-            
-            negozi_map = {negozio: df_negozi[df_negozi['Des Negozio'] == negozio].iloc[0] for negozio in negozi_validi}
-            
-            # Funzione per calcolare la media avanzamenti
-            def calcola_media_avanzamenti(codici_funzione, negozio):
-                avanzamenti = []
-                for codice in codici_funzione:
-                    if codice in df_avanzamenti.columns:
-                        avanzamenti.append(df_avanzamenti.loc[df_avanzamenti['Des Negozio'] == negozio, codice].mean())
-                    else:
-                        avanzamenti.append(0)  # Valore zero se la funzione non è presente
-                return sum(avanzamenti) / len(avanzamenti) if avanzamenti else 0
-            
-            # Funzione per calcolare la media ponderata combinata
-            def calcola_media_ponderata_combinata(row, codici_funzione, negozio):
-                media_ponderata = calcola_media_ponderata_con_controllo(row, codici_funzione, negozi_map[negozio])
-                media_avanzamenti = calcola_media_avanzamenti(codici_funzione, negozio)
-                return (I1 * media_ponderata + I2 * media_avanzamenti) / 100, media_ponderata, media_avanzamenti
-            
-            # Funzione per calcolare la media ponderata esistente
-            def calcola_media_ponderata_con_controllo(row, codici_funzione, negozio_row):
-                total_weighted_st = 0
-                total_delivered = 0
-                for codice in codici_funzione:
-                    col_delivered = f"{codice} Somma di Total Delivered"
-                    col_st = f"{codice} Media di ST value"
-                    if col_delivered in negozio_row.index and col_st in negozio_row.index:
-                        delivered_value = negozio_row[col_delivered]
-                        st_value = negozio_row[col_st]
-                        if delivered_value > 0:
-                            total_weighted_st += st_value * delivered_value
-                            total_delivered += delivered_value
-                return total_weighted_st / total_delivered if total_delivered > 0 else 0
-            
-            # Calcola il totale dello stock dal dataframe df_stock
-            def calcola_stock_totale(codici_funzione):
-                return df_stock[[codice for codice in codici_funzione if codice in df_stock.columns]].sum().sum()
-            
-            # Calcola lo stock per un singolo negozio
-            def calcola_stock_negozio(codici_funzione, negozio):
-                return df_stock.loc[df_stock['Des Negozio'] == negozio, [
-                    codice for codice in codici_funzione if codice in df_stock.columns
-                ]].sum().sum()
-            
-            # Funzione per calcolare il punteggio P
-            def calcola_punteggio_P(media_ponderata_combinata, codici_funzione, negozio):
-                stock_totale_funzioni = calcola_stock_totale(codici_funzione)
-                stock_funzioni_negozio = calcola_stock_negozio(codici_funzione, negozio)
-                ps = stock_funzioni_negozio / stock_totale_funzioni if stock_totale_funzioni > 0 else 0
-                if media_ponderata_combinata < 0:
-                    media_ponderata_combinata = 0
-                return (media_ponderata_combinata**alpha) / (1 + ps**(1 - alpha))
-            
-            # Lista funzioni non presenti in df_avanzamenti
-            funzioni_non_presenti_in_avanzamenti = [
-                col for col in df_prelievi.columns if col not in ['ID_PRELIEVO', 'Valore Totale'] and col not in df_avanzamenti.columns
-            ]
-            # Converti tutti gli elementi della lista in stringhe
-            funzioni_non_presenti_in_avanzamenti = list(map(str, funzioni_non_presenti_in_avanzamenti))
-            
-            results = []
-            negozi_assegnati = set()
-            valori_assegnati = {negozio: 0 for negozio in negozi_validi}
-            
-            progress_bar = st.progress(0)
-            total_rows = len(df_prelievi)
-            
-            for idx, (index, row) in enumerate(df_prelievi.iterrows()):
-                progress_bar.progress((idx + 1) / total_rows)
-                
-                id_prelievo = row['ID_PRELIEVO']
-                valore_totale = row['Valore Totale']
-                codici_funzione = [col for col in row.index if col != 'ID_PRELIEVO' and col != "Valore Totale" and row[col] > 0]
-                
-                # Controlla funzioni non presenti in df_negozi
-                funzioni_non_presenti = [codice for codice in codici_funzione if f"{codice} Somma di Total Delivered" not in df_negozi.columns]
-                if len(funzioni_non_presenti) == len(codici_funzione):  # Tutte le funzioni sono mancanti
-                    results.append([
-                        str(id_prelievo), 
-                        "Nessun negozio disponibile (TUTTE FUNZIONI NON PRESENTI)", 
-                        0,
-                        0, 
-                        0,
-                        0, 
-                        0, 
-                        ",".join(map(str, funzioni_non_presenti)), 
-                        valore_totale
-                    ])
-                    continue  # Passa al prossimo pallet
-                  
-                if funzioni_non_presenti:  # Ignora funzioni non presenti
-                    codici_funzione = [codice for codice in codici_funzione if codice not in funzioni_non_presenti]
-                
-                negozi_e_ponderate = []
-                for negozio in negozi_validi:
-                    if negozio in negozi_assegnati:
-                        continue
-                    negozio_row = negozi_map[negozio]
-                    # Verifica che il negozio abbia "Total Delivered" > 0 per tutte le funzioni
-                    if all(negozio_row.get(f"{codice} Somma di Total Delivered", 0) > 0 for codice in codici_funzione):
-                        ponderata_combinata, media_ponderata, media_avanzamenti = calcola_media_ponderata_combinata(negozio_row, codici_funzione, negozio)
-                        punteggio = calcola_punteggio_P(ponderata_combinata, codici_funzione, negozio)
-                        stock_totale_funzioni = calcola_stock_totale(codici_funzione)
-                        stock_funzioni_negozio = calcola_stock_negozio(codici_funzione, negozio)
-                        ps = stock_funzioni_negozio / stock_totale_funzioni if stock_totale_funzioni > 0 else 0
-                        negozi_e_ponderate.append((negozio, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti))
-                
-                negozi_e_ponderate.sort(key=lambda x: x[1], reverse=True)
-                negozio_assegnato = None
-                for candidato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti in negozi_e_ponderate:
-                    negozio_assegnato = candidato
-                    valori_assegnati[negozio_assegnato] += valore_totale
-                    negozi_assegnati.add(negozio_assegnato)
-                    results.append([str(id_prelievo), negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti, ",".join(map(str, codici_funzione)), valore_totale])
-                    break
-                    
-                if not negozio_assegnato:
-                    results.append([str(id_prelievo), "Nessun negozio disponibile", 0, 0, 0, 0, 0, ",".join(map(str, codici_funzione)), valore_totale])
-            
-            progress_bar.empty()
-            
-            # Create results dataframe
-            df_results = pd.DataFrame(results, columns=["ID_PRELIEVO", "Negozio Assegnato", "Punteggio", "Percentuale Stock", "Media Ponderata Combinata", "Media Ponderata", "Media Avanzamenti", "Funzioni presenti", "Valore Totale"])
-            df_results['ID_PRELIEVO'] = df_results['ID_PRELIEVO'].apply(lambda x: str(x).split('.')[0] if '.' in str(x) else str(x))
-            
-            # RIASSEGNAZIONE AUTOMATICA DEI PALLET MANCANTI
-            pallet_non_assegnati = df_results[df_results["Negozio Assegnato"] == "Nessun negozio disponibile"]
-            
-            if not pallet_non_assegnati.empty:
-                st.info("🔄 Avvio riassegnazione automatica dei pallet mancanti...")
-                
-                # Calcola la soglia massima automaticamente
-                max_pallet_valore = df_prelievi['Valore Totale'].max()
-                soglia_massima = max_pallet_valore * soglia_massima_moltiplicatore
-                
-                st.info(f"Soglia massima calcolata: {soglia_massima:.2f} (valore max pallet: {max_pallet_valore:.2f} × {soglia_massima_moltiplicatore})")
-                
-                with st.spinner("Riassegnazione in corso..."):
-                    pallet_assegnati_nella_riassegnazione = set()
-                    
-                    progress_bar2 = st.progress(0)
-                    total_unassigned = len(pallet_non_assegnati)
-                    
-                    for idx, (index, row) in enumerate(pallet_non_assegnati.iterrows()):
-                        progress_bar2.progress((idx + 1) / total_unassigned)
-                        
-                        id_prelievo = row['ID_PRELIEVO']
-                        valore_totale = row['Valore Totale']
-                        codici_funzione = row['Funzioni presenti'].split(',')
-                        # Convertiamo ogni elemento della lista in int
-                        codici_funzione = [int(codice) for codice in codici_funzione if codice.strip().isdigit()]
-                        
-                        negozi_e_ponderate = []
-                        for negozio in negozi_validi:
-                            if (valori_assegnati[negozio] + valore_totale <= soglia_massima) and (negozio not in pallet_assegnati_nella_riassegnazione):
-                                negozio_row = negozi_map[negozio]
-                                # Controlla che il negozio abbia "Total Delivered" > 0 per tutte le funzioni
-                                if all(negozio_row.get(f"{codice} Somma di Total Delivered", 0) > 0 for codice in codici_funzione):
-                                    ponderata_combinata, media_ponderata, media_avanzamenti = calcola_media_ponderata_combinata(negozio_row, codici_funzione, negozio)
-                                    punteggio = calcola_punteggio_P(ponderata_combinata, codici_funzione, negozio)
-                                    stock_totale_funzioni = calcola_stock_totale(codici_funzione)
-                                    stock_funzioni_negozio = calcola_stock_negozio(codici_funzione, negozio)
-                                    ps = stock_funzioni_negozio / stock_totale_funzioni if stock_totale_funzioni > 0 else 0
-                                    negozi_e_ponderate.append((negozio, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti))
-                        
-                        negozi_e_ponderate.sort(key=lambda x: x[1], reverse=True)
-                        
-                        if negozi_e_ponderate:
-                            negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti = negozi_e_ponderate[0]
-                            df_results.loc[df_results['ID_PRELIEVO'] == id_prelievo, ['Negozio Assegnato', 'Punteggio', 'Percentuale Stock', 'Media Ponderata Combinata', 'Media Ponderata', 'Media Avanzamenti']] = [negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti]
-                            valori_assegnati[negozio_assegnato] += valore_totale
-                            pallet_assegnati_nella_riassegnazione.add(negozio_assegnato)
-                    
-                    progress_bar2.empty()
-                    st.success("✅ Riassegnazione automatica completata!")
-            
-            # Store in session state
-            st.session_state.df_results = df_results
-            st.session_state.processing_complete = True
-        
-        # Display results
-        st.success("✅ Assegnazione completata!")
-        
-        # Summary metrics - ESATTO COME ORIGINALE
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            total_pallets = len(st.session_state.df_results)
-            st.metric("Totale Pallet", total_pallets)
-        
-        with col2:
-            # ESATTO COME ORIGINALE - conta i pallet NON assegnati e sottrae dal totale
-            pallet_non_assegnati = st.session_state.df_results[st.session_state.df_results["Negozio Assegnato"] == "Nessun negozio disponibile"]
-            assigned_pallets = total_pallets - len(pallet_non_assegnati)
-            st.metric("Pallet Assegnati", assigned_pallets)
-        
-        with col3:
-            unassigned_pallets = len(pallet_non_assegnati)
-            st.metric("Pallet Non Assegnati", unassigned_pallets)
+        params = ParametriAssegnazione(
+            I1=I1,
+            alpha=alpha,
+            soglia_delivered=soglia_delivered,
+            soglia_massima_moltiplicatore=soglia_massima_moltiplicatore,
+            modalita=modalita,
+            workers=int(workers)
+        )
+        try:
+            params.valida()
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
         
-        with col4:
-            assignment_rate = (assigned_pallets / total_pallets) * 100 if total_pallets > 0 else 0
-            st.metric("Tasso di Assegnazione", f"{assignment_rate:.1f}%")
+        # Stessi file e parametri già calcolati: risultati ripresi dall'archivio senza ricalcolo,
+        # a meno che servano la profilazione o un confronto non salvato
+        run = None if profila else archivio.carica_run(chiave_run(chiave_input, params))
+        if run is not None and (run[2] is not None or not confronta):
+            apri_run_archiviato(run)
+            lavoro = None
+        else:
+            lavoro = LavoroAssegnazione(
+                df, df_avanzamenti, df_prelievi, df_stock, params,
+                modello=st.session_state.modello_dati,
+                componenti=st.session_state.componenti_punteggio,
+                confronta=confronta,
+                profila=profila,
+                archivio=archivio,
+                chiave_input=chiave_input
+            ).avvia()
+            # Un solo lavoro per sessione: quelli già terminati vengono scartati
+            st.session_state.lavori = {lavoro.id: lavoro}
+            st.session_state.id_lavoro = lavoro.id
+            st.session_state.run_archiviato = None
+            lavoro_in_corso = True
+    
+    if lavoro_in_corso:
+        mostra_avanzamento(lavoro)
+    
+    elif lavoro is not None and lavoro.stato == ANNULLATO:
+        st.warning(f"⛔ Assegnazione annullata dopo {len(lavoro.righe)} pallet ({lavoro.durata():.1f} s)")
+        with st.expander("Visualizza risultati parziali"):
+            st.dataframe(lavoro.risultati_parziali(), use_container_width=True)
+    
+    elif lavoro is not None and lavoro.stato == ERRORE:
+        st.error(f"Errore durante l'assegnazione: {str(lavoro.errore)}")
+    
+    elif lavoro is not None and lavoro.stato == COMPLETATO:
         
-        # Results table
-        st.subheader("📋 Risultati Assegnazione")
-        st.dataframe(st.session_state.df_results, use_container_width=True)
+        # Store in session state, una sola volta per lavoro
+        if st.session_state.id_risultati != lavoro.id:
+            imposta_risultati(lavoro.df_results, lavoro.df_confronto, lavoro.prestazioni)
+            st.session_state.id_risultati = lavoro.id
         
-        # Download button
-        def convert_df_to_excel(df):
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Risultati')
-            return output.getvalue()
+        if 'riassegnazione' in lavoro.fasi:
+            st.info("🔄 Riassegnazione automatica dei pallet mancanti")
+            soglia_massima, max_pallet_valore = calcola_soglia_massima(
+                aggiungi_valore_totale(lavoro.tabelle[2]), lavoro.params.soglia_massima_moltiplicatore
+            )
+            st.info(f"Soglia massima calcolata: {soglia_massima:.2f} (valore max pallet: {max_pallet_valore:.2f} × {lavoro.params.soglia_massima_moltiplicatore})")
+            st.success("✅ Riassegnazione automatica completata!")
         
-        excel_data = convert_df_to_excel(st.session_state.df_results)
+        # Display results
+        st.success(f"✅ Assegnazione completata! ({lavoro.durata():.1f} s)")
         
-        st.download_button(
-            label="📥 Scarica Risultati (Excel)",
-            data=excel_data,
-            file_name="risultati_assegnazione.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True
+        mostra_risultati()
+    
+    elif st.session_state.run_archiviato is not None:
+        st.success(f"📂 Risultati ripresi dall'archivio: {descrivi_run(st.session_state.run_archiviato)}")
+        mostra_risultati()
+    
+    # Scenari what-if: le componenti del punteggio sono calcolate una volta sola,
+    # per ogni scenario vengono ricalcolati solo il punteggio P e l'assegnazione
+    with st.expander("🧪 Confronto scenari what-if"):
+        st.caption("Ogni riga è uno scenario; la modalità di assegnazione è quella scelta nella barra laterale.")
+        scenari_input = st.data_editor(
+            pd.DataFrame([{
+                'I1': I1,
+                'Alpha': alpha,
+                'Soglia delivered': soglia_delivered,
+                'Moltiplicatore': soglia_massima_moltiplicatore
+            }]),
+            num_rows="dynamic",
+            use_container_width=True,
+            key="scenari_input"
         )
         
-        # Final checks - ESATTO COME ORIGINALE
-        pallet_ancora_non_assegnati = st.session_state.df_results[st.session_state.df_results["Negozio Assegnato"] == "Nessun negozio disponibile"]
-        if not pallet_ancora_non_assegnati.empty:
-            st.warning("⚠️ Alcuni pallet rimangono ancora non assegnati dopo la riassegnazione automatica")
-            with st.expander("Visualizza pallet ancora non assegnati"):
-                st.dataframe(pallet_ancora_non_assegnati, use_container_width=True)
-        
-        pallet_senza_funzioni = st.session_state.df_results[st.session_state.df_results["Negozio Assegnato"] == "Nessun negozio disponibile (TUTTE FUNZIONI NON PRESENTI)"]
-        if not pallet_senza_funzioni.empty:
-            st.error("ATTENZIONE: ancora presenti pallet non assegnati (presenti pallet con tutte funzioni non presenti)")
+        # Disabilitato durante l'assegnazione in background, che usa le stesse componenti
+        if st.button("⚖️ Confronta scenari", use_container_width=True, disabled=lavoro_in_corso):
+            scenari = {
+                f"Scenario {i}": ParametriAssegnazione(
+                    I1=int(riga['I1']),
+                    alpha=float(riga['Alpha']),
+                    soglia_delivered=float(riga['Soglia delivered']),
+                    soglia_massima_moltiplicatore=float(riga['Moltiplicatore']),
+                    modalita=modalita
+                )
+                for i, riga in enumerate(scenari_input.dropna().to_dict('records'), start=1)
+            }
+            try:
+                for params_scenario in scenari.values():
+                    params_scenario.valida()
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
+            
+            with st.spinner("Calcolo degli scenari..."):
+                df_scenari, _ = confronta_scenari(
+                    df, df_avanzamenti, df_prelievi, df_stock, scenari,
+                    modello=st.session_state.modello_dati,
+                    componenti=st.session_state.componenti_punteggio
+                )
+            st.dataframe(df_scenari, use_container_width=True)
+
+elif st.session_state.run_archiviato is not None:
+    # Run riaperto dall'archivio senza caricare i file
+    st.success(f"📂 Risultati ripresi dall'archivio: {descrivi_run(st.session_state.run_archiviato)}")
+    tabelle_run = archivio.carica_ingresso(st.session_state.run_archiviato['chiave_input'])
+    if tabelle_run is not None:
+        with st.expander("📊 Tabelle in ingresso del run"):
+            for nome_tabella, tabella in zip(("ST", "AVANZAMENTI", "PRELIEVI", "STOCK"), tabelle_run):
+                st.caption(f"{nome_tabella}: {len(tabella)} righe")
+                st.dataframe(tabella.head(), use_container_width=True)
+    mostra_risultati()
 
 else:
     st.info("👆 Carica tutti i file richiesti nella barra laterale per iniziare")
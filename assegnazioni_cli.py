@@ -0,0 +1,173 @@
+"""Esecuzione da riga di comando dell'assegnazione pallet, senza Streamlit.
+
+Esempio:
+
+    python assegnazioni_cli.py --st ST.xlsx --avanzamenti AVANZAMENTI.xlsx \\
+        --prelievi PRELIEVI.xlsx --stock STOCK.xlsx -o risultati_assegnazione.xlsx
+
+Con `--archivio CARTELLA` i risultati vengono salvati nell'archivio dei run
+condiviso con l'app, e un run con gli stessi file e parametri già
+calcolato viene ripreso dall'archivio senza ricalcolo.
+"""
+import argparse
+import os
+import sys
+import time
+
+from tqdm import tqdm
+
+from archivio import ArchivioRun, chiave_run
+from assegnazione import (
+    MODALITA,
+    NESSUN_NEGOZIO,
+    ParametriAssegnazione,
+    assegna_pallet_in_streaming,
+    assign_pallets,
+    confronta_modalita,
+    misura_speedup,
+)
+from esportazione import esporta, formato_da_percorso
+from ingestione import FlussoPrelievi, carica_tabelle, carica_tabelle_negozi, hash_file
+from strumentazione import configura_log, registra_prestazioni
+
+
+def crea_parser():
+    parser = argparse.ArgumentParser(description="Assegnazione dei pallet ai negozi (un pallet per negozio con riassegnazione automatica).")
+    parser.add_argument('--st', required=True, help="Tabella ST (Excel)")
+    parser.add_argument('--avanzamenti', required=True, help="Tabella AVANZAMENTI (Excel)")
+    parser.add_argument('--prelievi', required=True, help="File PRELIEVI (Excel, oppure CSV con --streaming)")
+    parser.add_argument('--stock', required=True, help="File STOCK (Excel)")
+    parser.add_argument('-o', '--output', default='risultati_assegnazione.xlsx', help="File dei risultati: .xlsx, .csv o .parquet")
+    parser.add_argument('--I1', type=int, default=70, help="Peso media ponderata (%%), I2 = 100 - I1")
+    parser.add_argument('--alpha', type=float, default=0.7, help="Parametro alpha del punteggio P")
+    parser.add_argument('--soglia-delivered', type=float, default=100000.0, help="Soglia minima del Total Delivered dei negozi")
+    parser.add_argument('--moltiplicatore', type=float, default=2.0, help="Moltiplicatore della soglia massima per la riassegnazione")
+    parser.add_argument('--modalita', choices=MODALITA, default='greedy', help="Modalità di assegnazione: greedy nell'ordine del file oppure ottima globale")
+    parser.add_argument('--confronta', action='store_true', help="Confronta le modalità su punteggio totale e tasso di assegnazione")
+    parser.add_argument('--workers', type=int, default=1, help="Numero di processi per il calcolo dei punteggi")
+    parser.add_argument('--misura-speedup', action='store_true', help="Misura tempi e speedup con 1, 2, 4 e 8 processi")
+    parser.add_argument('--streaming', action='store_true', help="Legge PRELIEVI un pallet alla volta, assegnandoli man mano (senza --workers)")
+    parser.add_argument('--prestazioni', action='store_true', help="Mostra tempi, chiamate e righe per fase e li scrive come log JSON su stderr")
+    parser.add_argument('--profilo', metavar='FILE', help="Scrive in FILE il report cProfile dell'esecuzione")
+    parser.add_argument('--archivio', metavar='CARTELLA', help="Archivio dei run: riprende i risultati già calcolati e salva quelli nuovi")
+    parser.add_argument('--quiet', action='store_true', help="Non mostrare l'avanzamento")
+    return parser
+
+
+class BarraAvanzamento:
+    """Callback di avanzamento che mostra una barra tqdm per ogni fase."""
+
+    def __init__(self, disabilitata=False):
+        self.disabilitata = disabilitata
+        self.barra = None
+
+    def __call__(self, fase, completati, totale):
+        if completati == 0:
+            self.chiudi()
+            self.barra = tqdm(total=totale, desc=fase, unit='pallet', disable=self.disabilitata, file=sys.stderr)
+        else:
+            self.barra.update(completati - self.barra.n)
+
+    def chiudi(self):
+        if self.barra is not None:
+            self.barra.close()
+            self.barra = None
+
+
+def main(argv=None):
+    parser = crea_parser()
+    args = parser.parse_args(argv)
+    if args.streaming and (args.confronta or args.misura_speedup):
+        parser.error("--confronta e --misura-speedup richiedono il file PRELIEVI completo, non --streaming")
+    if args.streaming and args.workers > 1:
+        parser.error("--workers richiede il file PRELIEVI completo, non --streaming")
+    params = ParametriAssegnazione(
+        I1=args.I1,
+        alpha=args.alpha,
+        soglia_delivered=args.soglia_delivered,
+        soglia_massima_moltiplicatore=args.moltiplicatore,
+        modalita=args.modalita,
+        workers=args.workers,
+    )
+    try:
+        params.valida()
+        formato = formato_da_percorso(args.output)
+    except ValueError as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 2
+
+    if args.prestazioni:
+        configura_log(sys.stderr)
+
+    archivio = run = None
+    if args.archivio is not None:
+        try:
+            archivio = ArchivioRun(args.archivio)
+        except OSError as e:
+            print(f"Attenzione: archivio {args.archivio} non disponibile: {e}", file=sys.stderr)
+    if archivio is not None:
+        chiave_input = hash_file(args.st, args.avanzamenti, args.prelievi, args.stock)
+        chiave = chiave_run(chiave_input, params)
+        # La profilazione richiede di eseguire davvero l'assegnazione
+        if args.profilo is None:
+            run = archivio.carica_run(chiave)
+
+    inizio = time.perf_counter()
+    with registra_prestazioni(profila=args.profilo is not None) as registro:
+        barra = BarraAvanzamento(disabilitata=args.quiet)
+        try:
+            if run is not None:
+                _, df_results, _ = run
+                print(f"Run già calcolato: risultati ripresi dall'archivio {args.archivio} ({chiave[:12]})", file=sys.stderr)
+                if args.confronta or args.misura_speedup:
+                    df, df_avanzamenti, df_prelievi, df_stock = carica_tabelle(args.st, args.avanzamenti, args.prelievi, args.stock)
+            elif args.streaming:
+                df, df_avanzamenti, df_stock = carica_tabelle_negozi(args.st, args.avanzamenti, args.stock)
+                formato_prelievi = 'csv' if args.prelievi.lower().endswith('.csv') else 'xlsx'
+                flusso = FlussoPrelievi(args.prelievi, formato_prelievi)
+                df_results = assegna_pallet_in_streaming(
+                    df, df_avanzamenti, df_stock, flusso.pallet(), params, progresso=barra, totale=flusso.totale
+                )
+            else:
+                df, df_avanzamenti, df_prelievi, df_stock = carica_tabelle(args.st, args.avanzamenti, args.prelievi, args.stock)
+                df_results = assign_pallets(df, df_avanzamenti, df_prelievi, df_stock, params, progresso=barra)
+        finally:
+            barra.chiudi()
+        tempo_s = time.perf_counter() - inizio
+        esporta(df_results, args.output, formato)
+    # Il file di output è già scritto: un errore dell'archivio non lo invalida
+    if archivio is not None and run is None:
+        try:
+            if not args.streaming:
+                archivio.salva_ingresso(
+                    chiave_input, (df, df_avanzamenti, df_prelievi, df_stock),
+                    file=[os.path.basename(p) for p in (args.st, args.avanzamenti, args.prelievi, args.stock)]
+                )
+            archivio.salva_run(chiave_input, params, df_results, tempo_s=tempo_s)
+        except Exception as e:
+            print(f"Attenzione: run non salvato nell'archivio {args.archivio}: {e}", file=sys.stderr)
+    if args.prestazioni:
+        print(registro.tabella().to_string(float_format=lambda v: f"{v:.3f}"))
+    if args.profilo is not None:
+        with open(args.profilo, 'w', encoding='utf-8') as f:
+            f.write(registro.profilo)
+
+    if args.confronta:
+        df_confronto, _ = confronta_modalita(df, df_avanzamenti, df_prelievi, df_stock, params)
+        print(df_confronto.to_string(float_format=lambda v: f"{v:.3f}"))
+
+    if args.misura_speedup:
+        df_speedup = misura_speedup(df, df_avanzamenti, df_prelievi, df_stock, params)
+        print(df_speedup.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    totale = len(df_results)
+    non_assegnati = int((df_results["Negozio Assegnato"] == NESSUN_NEGOZIO).sum())
+    print(
+        f"Pallet: {totale}, assegnati: {totale - non_assegnati}, non assegnati: {non_assegnati} "
+        f"({time.perf_counter() - inizio:.1f} s) -> {args.output}"
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
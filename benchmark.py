@@ -0,0 +1,184 @@
+"""Benchmark riproducibile della pipeline di assegnazione su dati sintetici.
+
+Per ogni dimensione richiesta genera i file con `dati_sintetici`, poi
+misura separatamente le fasi della pipeline greedy: lettura dei file,
+costruzione del modello, eleggibilità, punteggi, primo passaggio,
+riassegnazione ed esportazione Excel. I tempi vengono misurati in un
+primo run; il picco di memoria di ogni fase (tracemalloc) in un secondo
+run identico, così il tracciamento non altera i tempi.
+
+Esempio:
+
+    python benchmark.py --pallet 1000 5000 20000 -o benchmark.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import datetime, timezone
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from assegnazione import (
+    ParametriAssegnazione,
+    aggiungi_valore_totale,
+    assegnazione_principale,
+    calcola_soglia_massima,
+    insiemi_funzioni,
+    pallet_da_prelievi,
+    riassegna_pallet_mancanti,
+    riepilogo_risultati,
+)
+from dati_sintetici import contenuti_excel, genera_tabelle, scrivi_file
+from esportazione import esporta
+from ingestione import carica_tabelle
+from modello_dati import ModelloDati
+from punteggi import CachePunteggi, calcola_punteggi, negozi_eleggibili
+
+# Fasi misurate, nell'ordine di esecuzione
+FASI = ('ingestione', 'modello', 'eleggibilita', 'punteggi', 'greedy', 'riassegnazione', 'esportazione')
+
+
+class Cronometro:
+    """Esegue le fasi registrando tempo e, se richiesto, picco di memoria."""
+
+    def __init__(self, traccia_memoria=False):
+        self.traccia_memoria = traccia_memoria
+        self.fasi = {}
+
+    def __call__(self, fase, funzione):
+        if self.traccia_memoria:
+            tracemalloc.start()
+        inizio = time.perf_counter()
+        try:
+            risultato = funzione()
+        finally:
+            tempo = time.perf_counter() - inizio
+            if self.traccia_memoria:
+                _, picco = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        self.fasi[fase] = {'tempo_s': tempo}
+        if self.traccia_memoria:
+            self.fasi[fase]['picco_memoria_mb'] = picco / 2 ** 20
+        return risultato
+
+
+def esegui_pipeline(contenuti, params, misura):
+    """Esegue la pipeline greedy una fase alla volta attraverso `misura(fase, funzione)`.
+
+    Restituisce il DataFrame dei risultati, uguale a quello di `assign_pallets`.
+    """
+    df, df_avanzamenti, df_prelievi, df_stock = misura('ingestione', lambda: carica_tabelle(*map(BytesIO, contenuti)))
+    modello = misura('modello', lambda: ModelloDati(df, df_avanzamenti, df_stock))
+
+    df_prelievi = aggiungi_valore_totale(df_prelievi)
+    negozi_validi = modello.negozi_validi(params.soglia_delivered)
+    insiemi = insiemi_funzioni(modello, df_prelievi)
+    candidati = misura('eleggibilita', lambda: [negozi_eleggibili(modello, list(codici), negozi_validi) for codici in insiemi])
+
+    cache = CachePunteggi(modello, negozi_validi, params.I1, params.I2, params.alpha)
+
+    def calcola_tutti():
+        for codici, negozi in zip(insiemi, candidati):
+            cache.voci[codici] = (negozi, calcola_punteggi(modello, list(codici), negozi, params.I1, params.I2, params.alpha))
+            cache.miss += 1
+
+    misura('punteggi', calcola_tutti)
+    df_results, valori_assegnati = misura('greedy', lambda: assegnazione_principale(
+        modello, pallet_da_prelievi(df_prelievi), negozi_validi, cache, totale=len(df_prelievi)
+    ))
+
+    soglia_massima, _ = calcola_soglia_massima(df_prelievi, params.soglia_massima_moltiplicatore)
+    df_results = misura('riassegnazione', lambda: riassegna_pallet_mancanti(
+        modello, df_results, negozi_validi, valori_assegnati, soglia_massima, cache
+    ))
+    misura('esportazione', lambda: esporta(df_results, BytesIO(), 'xlsx'))
+    return df_results
+
+
+def misura_dimensione(n_pallet, params, traccia_memoria=True, cartella_dati=None, **opzioni_dati):
+    """Genera i dati per `n_pallet` pallet ed esegue il benchmark delle fasi."""
+    tabelle = genera_tabelle(n_pallet=n_pallet, **opzioni_dati)
+    if cartella_dati is not None:
+        scrivi_file(f"{cartella_dati}/pallet_{n_pallet}", tabelle)
+    contenuti = contenuti_excel(tabelle)
+
+    tempi = Cronometro()
+    df_results = esegui_pipeline(contenuti, params, tempi)
+    fasi = tempi.fasi
+    if traccia_memoria:
+        memoria = Cronometro(traccia_memoria=True)
+        esegui_pipeline(contenuti, params, memoria)
+        for fase, misure in memoria.fasi.items():
+            fasi[fase]['picco_memoria_mb'] = misure['picco_memoria_mb']
+
+    riepilogo = riepilogo_risultati(df_results)
+    return {
+        'pallet': n_pallet,
+        **opzioni_dati,
+        'dimensione_file_bytes': dict(zip(('st', 'avanzamenti', 'prelievi', 'stock'), map(len, contenuti))),
+        'fasi': fasi,
+        'tempo_totale_s': sum(misure['tempo_s'] for misure in fasi.values()),
+        'pallet_assegnati': riepilogo['Pallet assegnati'],
+        'punteggio_totale': float(df_results['Punteggio'].sum()),
+    }
+
+
+def crea_parser():
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline di assegnazione su dati sintetici.")
+    parser.add_argument('--pallet', type=int, nargs='+', default=[1000, 5000, 20000], help="Numeri di pallet da misurare")
+    parser.add_argument('--negozi', type=int, default=300, help="Numero di negozi")
+    parser.add_argument('--funzioni', type=int, default=80, help="Numero di codici funzione")
+    parser.add_argument('--densita', type=float, default=0.6, help="Frazione di negozi con Total Delivered > 0 per funzione")
+    parser.add_argument('--funzioni-per-pallet', type=float, default=4, help="Numero medio di funzioni per pallet")
+    parser.add_argument('--seed', type=int, default=0, help="Seme del generatore")
+    parser.add_argument('--soglia-delivered', type=float, default=100000.0, help="Soglia minima del Total Delivered dei negozi")
+    parser.add_argument('--senza-memoria', action='store_true', help="Non misurare il picco di memoria (un solo run per dimensione)")
+    parser.add_argument('--salva-dati', metavar='CARTELLA', help="Salva anche i file Excel generati")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="File JSON dei risultati")
+    return parser
+
+
+def main(argv=None):
+    args = crea_parser().parse_args(argv)
+    params = ParametriAssegnazione(soglia_delivered=args.soglia_delivered)
+    params.valida()
+    opzioni_dati = {
+        'n_negozi': args.negozi,
+        'n_funzioni': args.funzioni,
+        'densita': args.densita,
+        'funzioni_per_pallet': args.funzioni_per_pallet,
+        'seed': args.seed,
+    }
+    risultati = []
+    for n_pallet in args.pallet:
+        risultato = misura_dimensione(
+            n_pallet, params, traccia_memoria=not args.senza_memoria, cartella_dati=args.salva_dati, **opzioni_dati
+        )
+        risultati.append(risultato)
+        dettaglio = ", ".join(f"{fase} {misure['tempo_s']:.2f} s" for fase, misure in risultato['fasi'].items())
+        print(f"{n_pallet} pallet: {risultato['tempo_totale_s']:.2f} s ({dettaglio})")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'ambiente': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'piattaforma': platform.platform(),
+            },
+            'parametri': asdict(params),
+            'risultati': risultati,
+        }, f, indent=2)
+    print(f"-> {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Generatore di dati sintetici riproducibili per benchmark e prove.
+
+Produce le quattro tabelle in ingresso nello stesso formato dei file reali:
+la tabella ST con tre colonne per funzione (Total Delivered, Total Sales,
+ST value), la riga dei codici funzione e la riga delle intestazioni che
+`ingestione.leggi_tabella_st` ricostruisce; AVANZAMENTI, PRELIEVI e STOCK
+con una colonna per codice funzione.
+"""
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Nomi dei file scritti da `scrivi_file`, nell'ordine di `carica_tabelle`
+NOMI_FILE = ('ST.xlsx', 'AVANZAMENTI.xlsx', 'PRELIEVI.xlsx', 'STOCK.xlsx')
+
+# Codice presente nei PRELIEVI ma non nella tabella ST
+CODICE_ASSENTE = 99999
+
+
+def genera_tabelle(n_negozi=300, n_funzioni=80, n_pallet=1000, densita=0.6, funzioni_per_pallet=4,
+                   frazione_negozi_mancanti=0.05, seed=0):
+    """Genera le tabelle grezze (st, avanzamenti, prelievi, stock).
+
+    `densita` è la frazione di negozi con Total Delivered > 0 per ogni
+    funzione; `funzioni_per_pallet` il numero medio di funzioni con
+    quantità > 0 in un pallet. Una parte dei negozi manca da AVANZAMENTI e
+    STOCK e una parte delle funzioni manca da ciascuna delle due tabelle,
+    come nei file reali.
+    """
+    rng = np.random.default_rng(seed)
+    codici = sorted(int(c) for c in rng.choice(np.arange(100, 10 * max(n_funzioni, 100)), n_funzioni, replace=False))
+    negozi = [f"NEGOZIO {i:05d}" for i in range(n_negozi)]
+
+    # ST: intestazioni generiche, riga dei codici, riga dei nomi delle misure, dati
+    intestazioni = ['Des Negozio'] + [f"Colonna {k}" for k in range(1, 3 * n_funzioni + 1)]
+    riga_codici = [None] + [v for c in codici for v in (c, None, None)]
+    riga_misure = ['Des Negozio'] + ['Somma di Total Delivered', 'Somma di Total Sales', 'Media di ST value'] * n_funzioni
+    valori = np.empty((n_negozi, 3 * n_funzioni))
+    delivered = np.round(rng.uniform(1, 5000, (n_negozi, n_funzioni)) * (rng.random((n_negozi, n_funzioni)) < densita), 2)
+    valori[:, 0::3] = delivered
+    valori[:, 1::3] = np.round(delivered * rng.random((n_negozi, n_funzioni)), 2)
+    valori[:, 2::3] = np.round(rng.random((n_negozi, n_funzioni)), 4)
+    righe = [riga_codici, riga_misure] + [[negozio] + riga for negozio, riga in zip(negozi, valori.tolist())]
+    df_st = pd.DataFrame(righe, columns=intestazioni)
+
+    def negozi_presenti():
+        return [n for n in negozi if rng.random() >= frazione_negozi_mancanti]
+
+    # AVANZAMENTI: frazione di avanzamento per negozio e funzione
+    negozi_av = negozi_presenti()
+    codici_av = [c for c in codici if rng.random() >= 0.1]
+    df_avanzamenti = pd.DataFrame(np.round(rng.random((len(negozi_av), len(codici_av))), 4), columns=codici_av)
+    df_avanzamenti.insert(0, 'Des Negozio', negozi_av)
+
+    # PRELIEVI: poche funzioni con quantità > 0 per pallet
+    colonne_pr = codici + [CODICE_ASSENTE]
+    probabilita = min(1.0, funzioni_per_pallet / len(colonne_pr))
+    quantita = rng.integers(1, 50, (n_pallet, len(colonne_pr))) * (rng.random((n_pallet, len(colonne_pr))) < probabilita)
+    df_prelievi = pd.DataFrame(quantita, columns=colonne_pr)
+    df_prelievi.insert(0, 'ID_PRELIEVO', np.arange(1, n_pallet + 1, dtype=float))
+
+    # STOCK: pezzi a magazzino per negozio e funzione
+    negozi_stock = negozi_presenti()
+    codici_stock = [c for c in codici if rng.random() >= 0.1]
+    df_stock = pd.DataFrame(rng.integers(0, 500, (len(negozi_stock), len(codici_stock))), columns=codici_stock)
+    df_stock.insert(0, 'Des Negozio', negozi_stock)
+
+    return df_st, df_avanzamenti, df_prelievi, df_stock
+
+
+def contenuti_excel(tabelle):
+    """Contenuto dei file Excel delle tabelle generate, nell'ordine di `NOMI_FILE`."""
+    contenuti = []
+    for tabella in tabelle:
+        output = BytesIO()
+        tabella.to_excel(output, index=False, engine='xlsxwriter')
+        contenuti.append(output.getvalue())
+    return tuple(contenuti)
+
+
+def scrivi_file(cartella, tabelle):
+    """Scrive le tabelle generate in `cartella` e restituisce i percorsi dei file."""
+    cartella = Path(cartella)
+    cartella.mkdir(parents=True, exist_ok=True)
+    percorsi = []
+    for nome, contenuto in zip(NOMI_FILE, contenuti_excel(tabelle)):
+        percorso = cartella / nome
+        percorso.write_bytes(contenuto)
+        percorsi.append(percorso)
+    return percorsi
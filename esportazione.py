@@ -0,0 +1,131 @@
+"""Esportazione dei risultati in Excel, CSV e Parquet.
+
+Il file Excel viene scritto riga per riga con la modalità `constant_memory`
+di xlsxwriter, senza costruire l'intero foglio in memoria. I contenuti
+vengono generati solo alla prima richiesta e memorizzati per la versione
+dei risultati a cui appartengono.
+
+Parquet richiede un solo tipo per colonna: le colonne con valori misti (ad
+esempio codici negozio numerici e "Nessun negozio disponibile" in
+`Negozio Assegnato`) vengono scritte come testo.
+"""
+import math
+from io import BytesIO
+
+import pandas as pd
+import xlsxwriter
+
+from strumentazione import fase
+
+# Estensione e tipo MIME per ogni formato di esportazione
+FORMATI = {
+    'xlsx': ("Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'csv': ("CSV", "text/csv"),
+    'parquet': ("Parquet", "application/vnd.apache.parquet"),
+}
+
+# Righe convertite in oggetti Python per volta durante la scrittura dell'Excel
+RIGHE_PER_BLOCCO = 10000
+
+# Stesso stile delle intestazioni scritte da DataFrame.to_excel
+FORMATO_INTESTAZIONE = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+# Tipi inferiti da pandas per le colonne object che pyarrow non sa convertire
+TIPI_MISTI = ('mixed', 'mixed-integer')
+
+
+def _valore_cella(valore):
+    """Valore da scrivere in una cella: None per le celle vuote, come fa pandas."""
+    if valore is None:
+        return None
+    if isinstance(valore, float):
+        if math.isnan(valore):
+            return None
+        if math.isinf(valore):
+            return 'inf' if valore > 0 else '-inf'
+    return valore
+
+
+def colonne_miste(df):
+    """Colonne object con valori di tipi diversi, non scrivibili in Parquet così come sono."""
+    return [
+        colonna for colonna in df.columns
+        if df[colonna].dtype == object and pd.api.types.infer_dtype(df[colonna], skipna=True) in TIPI_MISTI
+    ]
+
+
+def testo_per_parquet(df, colonne=None):
+    """`df` con le colonne miste (o `colonne`) convertite in testo; i valori mancanti restano tali."""
+    if colonne is None:
+        colonne = colonne_miste(df)
+    if not colonne:
+        return df
+    df = df.copy()
+    for colonna in colonne:
+        df[colonna] = df[colonna].where(df[colonna].isna(), df[colonna].astype(str))
+    return df
+
+
+def scrivi_excel(df, destinazione, sheet_name='Risultati'):
+    """Scrive `df` in un file Excel (percorso o file-like) un blocco di righe alla volta."""
+    workbook = xlsxwriter.Workbook(destinazione, {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, [str(c) for c in df.columns], workbook.add_format(FORMATO_INTESTAZIONE))
+        riga = 1
+        for inizio in range(0, len(df), RIGHE_PER_BLOCCO):
+            blocco = df.iloc[inizio:inizio + RIGHE_PER_BLOCCO]
+            colonne = [blocco[c].tolist() for c in blocco.columns]
+            for valori in zip(*colonne):
+                for colonna, valore in enumerate(valori):
+                    valore = _valore_cella(valore)
+                    if valore is not None:
+                        worksheet.write(riga, colonna, valore)
+                riga += 1
+    finally:
+        workbook.close()
+
+
+def esporta(df, destinazione, formato):
+    """Scrive `df` in `destinazione` (percorso o file-like) nel formato indicato."""
+    if formato not in FORMATI:
+        raise ValueError(f"Formato di esportazione non valido: {formato!r} (ammessi: {', '.join(FORMATI)}).")
+    with fase(f'esportazione {formato}', righe=len(df)):
+        if formato == 'xlsx':
+            scrivi_excel(df, destinazione)
+        elif formato == 'csv':
+            df.to_csv(destinazione, index=False)
+        else:
+            testo_per_parquet(df).to_parquet(destinazione, index=False)
+
+
+def formato_da_percorso(percorso):
+    """Formato di esportazione dedotto dall'estensione del file."""
+    estensione = str(percorso).rsplit('.', 1)[-1].lower()
+    if estensione not in FORMATI:
+        raise ValueError(f"Estensione non supportata: .{estensione} (ammesse: {', '.join('.' + f for f in FORMATI)}).")
+    return estensione
+
+
+class EsportazioneRisultati:
+    """Contenuti esportati di una versione dei risultati, generati su richiesta.
+
+    Ogni formato viene serializzato una sola volta; una nuova versione dei
+    risultati richiede una nuova istanza.
+    """
+
+    def __init__(self, df_results, versione):
+        self.df_results = df_results
+        self.versione = versione
+        self.contenuti = {}
+
+    def contenuto(self, formato):
+        if formato not in self.contenuti:
+            output = BytesIO()
+            esporta(self.df_results, output, formato)
+            self.contenuti[formato] = output.getvalue()
+        return self.contenuti[formato]
+
+    def generatore(self, formato):
+        """Funzione senza argomenti che restituisce il contenuto, per `st.download_button`."""
+        return lambda: self.contenuto(formato)
@@ -0,0 +1,262 @@
+"""Lettura e normalizzazione dei quattro file Excel in ingresso.
+
+Le tabelle normalizzate vengono memorizzate in una cache indicizzata
+dall'hash del contenuto dei file, così i rerun di Streamlit dovuti ai
+widget della sidebar non rileggono gli Excel.
+
+Il file PRELIEVI può anche essere letto in streaming con `FlussoPrelievi`,
+un pallet alla volta, senza costruire il DataFrame completo.
+"""
+import csv
+import hashlib
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+
+from strumentazione import fase
+
+
+def leggi_tabella_st(sorgente):
+    """Legge la tabella ST ricostruendo le intestazioni funzione per funzione."""
+    df = pd.read_excel(sorgente, header=0)
+
+    # Supponiamo che la prima riga contenga i numeri da concatenare alle intestazioni
+    # Prendi la riga con i numeri sopra le colonne
+    numeri_colonne = df.iloc[0, 1::3].values  # I numeri sono nelle celle 2, 5, 8, ... (0-based index)
+    # Crea un elenco per le nuove intestazioni
+    nuove_intestazioni = ['Des Negozio']  # La prima colonna rimane invariata
+    # Aggiungi le intestazioni modificate con il numero
+    for i, numero in enumerate(numeri_colonne):
+        nuove_intestazioni.append(f"{numero} Somma di Total Delivered")
+        nuove_intestazioni.append(f"{numero} Somma di Total Sales")
+        nuove_intestazioni.append(f"{numero} Media di ST value")
+    # Sostituisci le intestazioni nel dataframe
+    df.columns = nuove_intestazioni
+    # Elimina la riga con i numeri
+    df = df.drop(index=0)
+    df = df.drop(index=1).reset_index(drop=True)
+    # Rimuovo eventuali righe con valori NaN nella colonna 'Des negozio'
+    df = df.dropna(subset=["Des Negozio"])
+    # Le righe di intestazione rendono object le colonne numeriche: tornano float
+    return df.fillna(0).infer_objects()
+
+
+def allinea_negozi(df, df_tabella):
+    """Estende `df_tabella` con una riga a zero per ogni negozio presente solo in ST.
+
+    Le righe esistenti restano invariate e nello stesso ordine; le righe dei
+    negozi mancanti vengono aggiunte in coda con un unico reindex. Il numero
+    di negozi aggiunti è riportato in `attrs['negozi_aggiunti']`.
+    """
+    presenti = pd.Index(df_tabella['Des Negozio']).unique()
+    mancanti = pd.Index(df['Des Negozio']).dropna().unique().difference(presenti, sort=False)
+    n_righe = len(df_tabella)
+    df_tabella = df_tabella.reset_index(drop=True).reindex(range(n_righe + len(mancanti)))
+    df_tabella.loc[n_righe:, 'Des Negozio'] = mancanti.to_numpy()
+    df_tabella = df_tabella.fillna(0)
+    df_tabella.attrs['negozi_aggiunti'] = len(mancanti)
+    return df_tabella
+
+
+def carica_tabelle_negozi(sorgente_st, sorgente_avanzamenti, sorgente_stock):
+    """Legge e normalizza le tabelle per negozio ST, AVANZAMENTI e STOCK.
+
+    AVANZAMENTI e STOCK vengono allineati all'elenco negozi della tabella ST.
+    Restituisce (df, df_avanzamenti, df_stock).
+    """
+    with fase('lettura ST') as misura:
+        df = leggi_tabella_st(sorgente_st)
+        misura.righe = len(df)
+
+    # Caricamento del file contenente gli AVANZAMENTI
+    with fase('lettura AVANZAMENTI') as misura:
+        df_avanzamenti = pd.read_excel(sorgente_avanzamenti).fillna(0)
+        df_avanzamenti = allinea_negozi(df, df_avanzamenti)
+        misura.righe = len(df_avanzamenti)
+
+    # Caricamento del file contenente lo STOCK
+    with fase('lettura STOCK') as misura:
+        df_stock = pd.read_excel(sorgente_stock).fillna(0)
+        df_stock = allinea_negozi(df, df_stock)
+        misura.righe = len(df_stock)
+
+    return df, df_avanzamenti, df_stock
+
+
+def carica_tabelle(sorgente_st, sorgente_avanzamenti, sorgente_prelievi, sorgente_stock):
+    """Legge e normalizza i quattro file.
+
+    Restituisce (df, df_avanzamenti, df_prelievi, df_stock).
+    """
+    df, df_avanzamenti, df_stock = carica_tabelle_negozi(sorgente_st, sorgente_avanzamenti, sorgente_stock)
+
+    # Caricamento del file contenente i PRELIEVI
+    with fase('lettura PRELIEVI') as misura:
+        df_prelievi = pd.read_excel(sorgente_prelievi).fillna(0)
+        misura.righe = len(df_prelievi)
+
+    return df, df_avanzamenti, df_prelievi, df_stock
+
+
+def _quantita(valore):
+    """Quantità di una cella PRELIEVI: zero per le celle vuote, come `fillna(0)`."""
+    if valore is None or valore == '':
+        return 0
+    if isinstance(valore, str):
+        valore = float(valore)
+        return int(valore) if valore.is_integer() else valore
+    return 0 if isinstance(valore, float) and math.isnan(valore) else valore
+
+
+def _nome_colonna(nome):
+    """Nome di colonna come lo restituisce `read_excel`: i codici numerici diventano int."""
+    if isinstance(nome, str) and nome.strip().isdigit():
+        return int(nome)
+    return nome
+
+
+class FlussoPrelievi:
+    """File PRELIEVI letto in streaming, una riga alla volta.
+
+    Excel viene letto con openpyxl in modalità `read_only`, CSV con il modulo
+    `csv`; in memoria restano solo la riga corrente e l'intestazione. Ogni
+    pallet diventa un record sparso (id_prelievo, indici, quantita) con le
+    sole colonne funzione di quantità diversa da zero; `pallet()` li
+    converte in (id_prelievo, codici_funzione, valore_totale) per
+    l'assegnazione. Le righe completamente vuote vengono saltate. Il flusso
+    si può percorrere una sola volta.
+    """
+
+    def __init__(self, sorgente, formato='xlsx'):
+        if formato == 'xlsx':
+            self._workbook = openpyxl.load_workbook(sorgente, read_only=True, data_only=True)
+            foglio = self._workbook.worksheets[0]
+            self.totale = foglio.max_row - 1 if foglio.max_row else None
+            self._righe = foglio.iter_rows(values_only=True)
+        elif formato == 'csv':
+            self._workbook = None
+            if isinstance(sorgente, (str, os.PathLike)):
+                testo = open(sorgente, newline='', encoding='utf-8-sig')
+            else:
+                testo = io.TextIOWrapper(sorgente, newline='', encoding='utf-8-sig')
+            self._testo = testo
+            self.totale = None
+            self._righe = csv.reader(testo)
+        else:
+            raise ValueError(f"Formato PRELIEVI non valido: {formato!r} (ammessi: xlsx, csv).")
+
+        intestazione = [_nome_colonna(nome) for nome in next(self._righe, ())]
+        if 'ID_PRELIEVO' not in intestazione:
+            self.chiudi()
+            raise ValueError("Colonna ID_PRELIEVO non trovata nel file PRELIEVI.")
+        self._colonna_id = intestazione.index('ID_PRELIEVO')
+        # Una colonna 'Valore Totale' già presente viene ricalcolata, come in `aggiungi_valore_totale`
+        self._posizioni_funzione = [k for k, nome in enumerate(intestazione) if k != self._colonna_id and nome != 'Valore Totale']
+        self.colonne_funzione = [intestazione[k] for k in self._posizioni_funzione]
+
+    def record(self):
+        """Genera i record sparsi (id_prelievo, indici, quantita) nell'ordine del file.
+
+        `indici` sono le posizioni in `colonne_funzione` delle quantità diverse da zero.
+        """
+        try:
+            for riga in self._righe:
+                if all(valore is None or valore == '' for valore in riga):
+                    continue
+                indici = []
+                quantita = []
+                for j, k in enumerate(self._posizioni_funzione):
+                    valore = _quantita(riga[k]) if k < len(riga) else 0
+                    if valore != 0:
+                        indici.append(j)
+                        quantita.append(valore)
+                id_prelievo = riga[self._colonna_id]
+                yield (0 if id_prelievo is None or id_prelievo == '' else id_prelievo), indici, quantita
+        finally:
+            self.chiudi()
+
+    def pallet(self):
+        """Genera (id_prelievo, codici_funzione, valore_totale) come `pallet_da_prelievi`."""
+        colonne = self.colonne_funzione
+        for id_prelievo, indici, quantita in self.record():
+            codici_funzione = [colonne[j] for j, q in zip(indici, quantita) if q > 0]
+            yield id_prelievo, codici_funzione, sum(quantita)
+
+    def chiudi(self):
+        if self._workbook is not None:
+            self._workbook.close()
+        else:
+            self._testo.close()
+
+
+def hash_contenuti(*contenuti):
+    """Hash SHA-256 dell'insieme dei contenuti dei file, nell'ordine dato."""
+    h = hashlib.sha256()
+    for contenuto in contenuti:
+        h.update(len(contenuto).to_bytes(8, 'little'))
+        h.update(contenuto)
+    return h.hexdigest()
+
+
+def hash_file(*percorsi, dimensione_blocco=2 ** 20):
+    """Come `hash_contenuti` sul contenuto dei file, letti a blocchi."""
+    h = hashlib.sha256()
+    for percorso in percorsi:
+        h.update(os.path.getsize(percorso).to_bytes(8, 'little'))
+        with open(percorso, 'rb') as f:
+            for blocco in iter(lambda: f.read(dimensione_blocco), b''):
+                h.update(blocco)
+    return h.hexdigest()
+
+
+class CacheIngestione:
+    """Cache LRU a dimensione limitata delle tabelle normalizzate.
+
+    La chiave è l'hash del contenuto dei quattro file; a ogni lettura
+    vengono restituite copie, così le modifiche del chiamante non
+    alterano la voce memorizzata. La cache può essere condivisa tra
+    thread (le sessioni Streamlit): le voci sono protette da un lock,
+    mentre la lettura dei file avviene fuori dal lock.
+    """
+
+    def __init__(self, max_voci=4):
+        self.max_voci = max_voci
+        self.voci = OrderedDict()
+        self.hit = 0
+        self.miss = 0
+        self.evizioni = 0
+        self._lock = threading.Lock()
+
+    def carica(self, contenuto_st, contenuto_avanzamenti, contenuto_prelievi, contenuto_stock):
+        """Restituisce (chiave, (df, df_avanzamenti, df_prelievi, df_stock))."""
+        chiave = hash_contenuti(contenuto_st, contenuto_avanzamenti, contenuto_prelievi, contenuto_stock)
+        with self._lock:
+            tabelle = self.voci.get(chiave)
+            if tabelle is not None:
+                self.hit += 1
+                self.voci.move_to_end(chiave)
+        if tabelle is None:
+            tabelle = carica_tabelle(
+                BytesIO(contenuto_st),
+                BytesIO(contenuto_avanzamenti),
+                BytesIO(contenuto_prelievi),
+                BytesIO(contenuto_stock),
+            )
+            with self._lock:
+                self.miss += 1
+                self.voci[chiave] = tabelle
+                self.voci.move_to_end(chiave)
+                while len(self.voci) > self.max_voci:
+                    self.voci.popitem(last=False)
+                    self.evizioni += 1
+        return chiave, tuple(tabella.copy() for tabella in tabelle)
+
+    def statistiche(self):
+        with self._lock:
+            return {'voci': len(self.voci), 'hit': self.hit, 'miss': self.miss, 'evizioni': self.evizioni}
@@ -0,0 +1,157 @@
+"""Esecuzione dell'assegnazione in background, fuori dallo script Streamlit.
+
+Un `LavoroAssegnazione` esegue `assign_pallets` in un thread separato; lo
+script legge lo stato del lavoro a ogni rerun senza bloccarsi. La fase e
+il numero di pallet elaborati vengono aggiornati al più ogni
+`INTERVALLO_AVANZAMENTO` secondi, non a ogni pallet; le righe già prodotte
+dal primo passaggio sono consultabili mentre il lavoro è in corso.
+
+L'annullamento è cooperativo: il thread lo rileva alla notifica di
+avanzamento successiva e si ferma sollevando `LavoroAnnullato`. Il calcolo
+parallelo dei punteggi (`workers` > 1) non notifica avanzamenti, quindi
+un annullamento richiesto in quella fase ha effetto all'inizio del primo
+passaggio.
+
+Con un `archivio.ArchivioRun` i risultati di un lavoro completato vengono
+salvati su disco dal thread stesso, anche se la sessione che lo ha avviato
+nel frattempo è stata chiusa.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from assegnazione import assign_pallets, confronta_modalita, crea_df_risultati
+from strumentazione import registra_prestazioni
+
+logger = logging.getLogger('assegnazione.lavori')
+
+# Secondi minimi tra due aggiornamenti dell'avanzamento
+INTERVALLO_AVANZAMENTO = 0.5
+
+# Stati di un lavoro
+IN_CORSO = 'in corso'
+COMPLETATO = 'completato'
+ANNULLATO = 'annullato'
+ERRORE = 'errore'
+
+
+class LavoroAnnullato(Exception):
+    """Sollevata nel thread del lavoro quando ne è stato richiesto l'annullamento."""
+
+
+class LavoroAssegnazione:
+    """Assegnazione (ed eventuale confronto tra modalità) eseguita in un thread.
+
+    Le tabelle e gli argomenti sono quelli di `assign_pallets`. Con
+    `confronta` viene eseguito anche `confronta_modalita`; con `profila`
+    l'assegnazione viene eseguita sotto cProfile. Alla fine il lavoro
+    contiene `df_results`, `df_confronto` e il `RegistroPrestazioni` in
+    `prestazioni`, oppure l'eccezione in `errore`. Con `archivio` e la
+    `chiave_input` dei file i risultati vengono salvati nell'archivio e la
+    chiave del run è in `chiave_run`.
+    """
+
+    def __init__(self, st_df, avanzamenti_df, prelievi_df, stock_df, params, modello=None, componenti=None,
+                 confronta=False, profila=False, archivio=None, chiave_input=None, intervallo=INTERVALLO_AVANZAMENTO):
+        self.id = uuid.uuid4().hex[:12]
+        self.tabelle = (st_df, avanzamenti_df, prelievi_df, stock_df)
+        self.params = params
+        self.modello = modello
+        self.componenti = componenti
+        self.confronta = confronta
+        self.profila = profila
+        self.archivio = archivio
+        self.chiave_input = chiave_input
+        self.intervallo = intervallo
+
+        self.stato = None
+        # (fase, completati, totale) all'ultimo aggiornamento
+        self.avanzamento = (None, 0, None)
+        self.fasi = []
+        self.righe = []
+        self.df_results = None
+        self.df_confronto = None
+        self.prestazioni = None
+        self.chiave_run = None
+        self.errore = None
+        self.inizio = None
+        self.fine = None
+        self._annullamento = threading.Event()
+        self._ultimo_aggiornamento = 0.0
+        self._thread = threading.Thread(target=self._esegui, name=f"assegnazione-{self.id}", daemon=True)
+
+    def avvia(self):
+        self.stato = IN_CORSO
+        self.inizio = time.time()
+        self._thread.start()
+        return self
+
+    def annulla(self):
+        """Chiede l'annullamento; il lavoro si ferma alla notifica successiva."""
+        self._annullamento.set()
+
+    @property
+    def in_corso(self):
+        return self.stato == IN_CORSO
+
+    @property
+    def annullamento_richiesto(self):
+        return self._annullamento.is_set()
+
+    def durata(self):
+        """Secondi trascorsi dall'avvio, fino alla fine se il lavoro è terminato."""
+        return (self.fine or time.time()) - self.inizio
+
+    def attendi(self, timeout=None):
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def risultati_parziali(self):
+        """DataFrame delle righe prodotte finora dal primo passaggio."""
+        return crea_df_risultati(self.righe[:])
+
+    def notifica(self, fase, completati, totale):
+        """Callback `progresso` dell'assegnazione, chiamata a ogni pallet."""
+        if self._annullamento.is_set():
+            raise LavoroAnnullato(self.id)
+        if completati == 0:
+            self.fasi.append(fase)
+        adesso = time.monotonic()
+        if completati == 0 or completati == totale or adesso - self._ultimo_aggiornamento >= self.intervallo:
+            self.avanzamento = (fase, completati, totale)
+            self._ultimo_aggiornamento = adesso
+
+    def _esegui(self):
+        try:
+            with registra_prestazioni(profila=self.profila) as registro:
+                df_results = assign_pallets(
+                    *self.tabelle, self.params, progresso=self.notifica,
+                    modello=self.modello, componenti=self.componenti, risultati=self.righe
+                )
+            self.prestazioni = registro
+            if self.confronta:
+                self.notifica('confronto', 0, None)
+                self.df_confronto, _ = confronta_modalita(
+                    *self.tabelle, self.params, modello=self.modello, componenti=self.componenti
+                )
+            self.df_results = df_results
+            if self.archivio is not None:
+                self._archivia()
+            self.stato = COMPLETATO
+        except LavoroAnnullato:
+            self.stato = ANNULLATO
+        except Exception as e:
+            self.errore = e
+            self.stato = ERRORE
+        finally:
+            self.fine = time.time()
+
+    def _archivia(self):
+        # Un errore di scrittura dell'archivio non invalida risultati già calcolati
+        try:
+            self.chiave_run = self.archivio.salva_run(
+                self.chiave_input, self.params, self.df_results, self.df_confronto, tempo_s=self.durata()
+            )
+        except Exception:
+            logger.exception("Salvataggio del run %s nell'archivio non riuscito", self.id)
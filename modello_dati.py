@@ -0,0 +1,153 @@
+"""Modello dati costruito una sola volta per ogni caricamento dei file.
+
+Ogni negozio è identificato da un intero, la sua posizione nell'ordine
+della tabella ST; ogni funzione dalla posizione della sua colonna. Il
+modello contiene la mappa funzione → posizione di colonna, le matrici
+dense negozio × funzione usate dal calcolo dei punteggi, l'indice invertito
+funzione → negozi con Total Delivered > 0 e la memoria dello stock totale
+per insieme di funzioni. Sostituisce le scansioni ripetute
+`df[df['Des Negozio'] == negozio]` e le letture per etichetta delle righe
+dei negozi nelle funzioni di calcolo.
+"""
+import numpy as np
+import pandas as pd
+
+SUFFISSO_DELIVERED = " Somma di Total Delivered"
+SUFFISSO_ST = " Media di ST value"
+
+
+def indice_righe(df):
+    """Indice negozio → array delle posizioni di riga in `df`."""
+    return df.groupby('Des Negozio', sort=False).indices
+
+
+def _matrice_per_negozio(df, righe, negozi, colonne, aggregazione):
+    """Matrice densa negozio × colonna aggregando le righe di ciascun negozio.
+
+    I negozi assenti da `df` hanno riga a zero, come la selezione vuota
+    del calcolo originale.
+    """
+    matrice = np.zeros((len(negozi), len(colonne)))
+    if not colonne:
+        return matrice
+    valori = df[colonne].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    for i, negozio in enumerate(negozi):
+        posizioni = righe.get(negozio)
+        if posizioni is None:
+            continue
+        if len(posizioni) == 1:
+            matrice[i] = valori[posizioni[0]]
+        elif aggregazione == 'media':
+            matrice[i] = valori[posizioni].sum(axis=0) / len(posizioni)
+        else:
+            matrice[i] = valori[posizioni].sum(axis=0)
+    return matrice
+
+
+class ModelloDati:
+    """Indici e matrici dense derivati dalle tabelle ST, AVANZAMENTI e STOCK."""
+
+    # Array numerici usati dal calcolo dei punteggi
+    ARRAY = ('delivered', 'st', 'bitset_delivered', 'avanzamenti', 'stock', 'totali_colonna_stock', 'totali_delivered')
+    # Mappe negozio/funzione/colonna usate dal calcolo dei punteggi
+    MAPPE = ('negozi', 'funzioni_st', 'colonne_avanzamenti', 'colonne_stock')
+
+    def __init__(self, df_negozi, df_avanzamenti, df_stock):
+        # Negozi nell'ordine di prima comparsa nella tabella ST: id negozio → nome
+        righe_negozi = {negozio: posizioni[0] for negozio, posizioni in indice_righe(df_negozi).items()}
+        self.negozi = list(righe_negozi)
+        self.posizioni_negozi = {negozio: i for i, negozio in enumerate(self.negozi)}
+
+        # Mappa funzione → posizione nelle matrici della tabella ST
+        self.funzioni_st = {}
+        for colonna in df_negozi.columns:
+            if colonna.endswith(SUFFISSO_DELIVERED):
+                prefisso = colonna[:-len(SUFFISSO_DELIVERED)]
+                if prefisso + SUFFISSO_ST in df_negozi.columns:
+                    self.funzioni_st[prefisso] = len(self.funzioni_st)
+        righe_st = df_negozi.iloc[[righe_negozi[negozio] for negozio in self.negozi]]
+        self.delivered = righe_st[[p + SUFFISSO_DELIVERED for p in self.funzioni_st]].to_numpy(dtype=float)
+        self.st = righe_st[[p + SUFFISSO_ST for p in self.funzioni_st]].to_numpy(dtype=float)
+        self.totali_delivered = self._somma_delivered()
+        # Indice invertito: per ogni funzione il bitset dei negozi con Total Delivered > 0
+        self.bitset_delivered = np.ascontiguousarray(np.packbits(self.delivered > 0, axis=0, bitorder='little').T)
+        self._posizioni_codici = {}
+
+        # AVANZAMENTI: media delle righe del negozio per ogni colonna funzione
+        colonne_av = [c for c in df_avanzamenti.columns if c != 'Des Negozio']
+        self.colonne_avanzamenti = {c: k for k, c in enumerate(colonne_av)}
+        self.avanzamenti = _matrice_per_negozio(df_avanzamenti, indice_righe(df_avanzamenti), self.negozi, colonne_av, 'media')
+
+        # STOCK: somma delle righe del negozio e totale di colonna su tutta la tabella
+        colonne_stock = [c for c in df_stock.columns if c != 'Des Negozio']
+        self.colonne_stock = {c: k for k, c in enumerate(colonne_stock)}
+        self.stock = _matrice_per_negozio(df_stock, indice_righe(df_stock), self.negozi, colonne_stock, 'somma')
+        self.totali_colonna_stock = df_stock[colonne_stock].apply(pd.to_numeric, errors='coerce').sum().to_numpy(dtype=float)
+        self._stock_totale = {}
+
+    @classmethod
+    def da_array(cls, mappe, array):
+        """Ricostruisce un modello per il solo calcolo dei punteggi.
+
+        `mappe` e `array` sono dizionari con le chiavi di MAPPE e ARRAY.
+        """
+        modello = cls.__new__(cls)
+        for nome in cls.MAPPE:
+            setattr(modello, nome, mappe[nome])
+        for nome in cls.ARRAY:
+            setattr(modello, nome, array[nome])
+        modello.posizioni_negozi = {negozio: i for i, negozio in enumerate(modello.negozi)}
+        modello._posizioni_codici = {}
+        modello._stock_totale = {}
+        return modello
+
+    def posizione_funzione(self, codice):
+        """Posizione della funzione nella tabella ST, None se assente.
+
+        Il nome di colonna viene ricostruito una sola volta per codice; la
+        chiave comprende il tipo perché ad esempio 5 e 5.0 danno prefissi diversi.
+        """
+        chiave = (type(codice), codice)
+        try:
+            return self._posizioni_codici[chiave]
+        except KeyError:
+            posizione = self._posizioni_codici[chiave] = self.funzioni_st.get(f"{codice}")
+            return posizione
+
+    def maschera_eleggibili(self, posizioni_funzioni):
+        """Maschera dei negozi con Total Delivered > 0 per tutte le funzioni indicate.
+
+        Intersezione dei bitset dell'indice invertito; `posizioni_funzioni`
+        non deve essere vuoto.
+        """
+        bitset = np.bitwise_and.reduce(self.bitset_delivered[posizioni_funzioni], axis=0)
+        return np.unpackbits(bitset, count=len(self.negozi), bitorder='little').view(bool)
+
+    def colonne_stock_funzioni(self, codici_funzione):
+        return [self.colonne_stock[c] for c in codici_funzione if c in self.colonne_stock]
+
+    def stock_totale(self, codici_funzione):
+        """Stock totale delle funzioni, memorizzato per insieme di funzioni."""
+        chiave = frozenset(codici_funzione)
+        totale = self._stock_totale.get(chiave)
+        if totale is None:
+            totale = self.totali_colonna_stock[self.colonne_stock_funzioni(codici_funzione)].sum()
+            self._stock_totale[chiave] = totale
+        return totale
+
+    def _somma_delivered(self):
+        """Somma del Total Delivered di tutte le funzioni per ogni negozio.
+
+        Somma volutamente una colonna alla volta, da sinistra a destra, come
+        il calcolo originale: `delivered.sum(axis=1)` usa la somma a coppie
+        e può differire nell'ultima cifra, cambiando l'esito del confronto
+        con la soglia per i negozi che vi cadono esattamente.
+        """
+        totale = np.zeros(len(self.negozi))
+        for j in range(self.delivered.shape[1]):
+            totale += self.delivered[:, j]
+        return totale
+
+    def negozi_validi(self, soglia_delivered):
+        """Posizioni dei negozi con Total Delivered complessivo oltre la soglia."""
+        return np.flatnonzero(self.totali_delivered >= soglia_delivered)
@@ -0,0 +1,224 @@
+"""Motore di calcolo vettoriale dei punteggi negozio × funzione.
+
+Per ogni pallet media ponderata, media avanzamenti, percentuale stock e
+punteggio P vengono calcolati per tutti i negozi candidati con un'unica
+operazione sulle matrici dense del `ModelloDati`.
+
+I risultati coincidono esattamente con il calcolo originale negozio per
+negozio: le somme sulle funzioni seguono lo stesso ordine delle somme
+Python/pandas originali e le potenze usano la stessa `pow` della libreria C.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from strumentazione import misurato
+
+# Insiemi di pesi (I1, I2, alpha) di cui `CacheComponenti` conserva i punteggi combinati
+MAX_PESI_COMBINATI = 4
+
+
+def negozi_eleggibili(modello, codici_funzione, posizioni):
+    """Filtra i negozi con Total Delivered > 0 per tutte le funzioni."""
+    posizioni_funzioni = [modello.posizione_funzione(codice) for codice in codici_funzione]
+    if None in posizioni_funzioni:
+        return posizioni[:0]
+    if not posizioni_funzioni:
+        return posizioni
+    return posizioni[modello.maschera_eleggibili(posizioni_funzioni)[posizioni]]
+
+
+def calcola_media_ponderata(modello, codici_funzione, posizioni):
+    totale_st_ponderato = np.zeros(len(posizioni))
+    totale_delivered = np.zeros(len(posizioni))
+    for codice in codici_funzione:
+        j = modello.posizione_funzione(codice)
+        if j is None:
+            continue
+        delivered = modello.delivered[posizioni, j]
+        positivo = delivered > 0
+        totale_st_ponderato += np.where(positivo, modello.st[posizioni, j] * delivered, 0.0)
+        totale_delivered += np.where(positivo, delivered, 0.0)
+    media = np.zeros(len(posizioni))
+    np.divide(totale_st_ponderato, totale_delivered, out=media, where=totale_delivered > 0)
+    return media
+
+
+@misurato(2)
+def calcola_media_avanzamenti(modello, codici_funzione, posizioni):
+    if not codici_funzione:
+        return np.zeros(len(posizioni))
+    somma = np.zeros(len(posizioni))
+    for codice in codici_funzione:
+        k = modello.colonne_avanzamenti.get(codice)
+        if k is not None:  # Valore zero se la funzione non è presente
+            somma += modello.avanzamenti[posizioni, k]
+    return somma / len(codici_funzione)
+
+
+@misurato(2)
+def calcola_stock_negozio(modello, codici_funzione, posizioni):
+    colonne = modello.colonne_stock_funzioni(codici_funzione)
+    return modello.stock[np.ix_(posizioni, colonne)].sum(axis=1)
+
+
+def calcola_percentuale_stock(modello, codici_funzione, posizioni):
+    stock_totale_funzioni = modello.stock_totale(codici_funzione)
+    if not stock_totale_funzioni > 0:
+        return np.zeros(len(posizioni))
+    return calcola_stock_negozio(modello, codici_funzione, posizioni) / stock_totale_funzioni
+
+
+def _potenza(valori, esponente):
+    """Potenza elemento per elemento con la `pow` scalare di Python.
+
+    `np.power` può usare implementazioni SIMD non correttamente arrotondate;
+    per riprodurre esattamente i punteggi si usa la potenza scalare, con NaN
+    per basi negative ed esponente non intero come per gli scalari numpy.
+    """
+    intero = float(esponente).is_integer()
+    return np.array(
+        [v ** esponente if v >= 0 or intero else np.nan for v in valori.tolist()],
+        dtype=float,
+    )
+
+
+@misurato(0)
+def calcola_punteggio_P(media_ponderata_combinata, percentuale_stock, alpha):
+    media = np.maximum(media_ponderata_combinata, 0)
+    return _potenza(media, alpha) / (1 + _potenza(percentuale_stock, 1 - alpha))
+
+
+def calcola_componenti(modello, codici_funzione, posizioni):
+    """Componenti del punteggio che non dipendono da I1, I2 e alpha.
+
+    Restituisce gli array (media_ponderata, media_avanzamenti, ps) allineati
+    a `posizioni`.
+    """
+    media_ponderata = calcola_media_ponderata(modello, codici_funzione, posizioni)
+    media_avanzamenti = calcola_media_avanzamenti(modello, codici_funzione, posizioni)
+    ps = calcola_percentuale_stock(modello, codici_funzione, posizioni)
+    return media_ponderata, media_avanzamenti, ps
+
+
+def combina_punteggi(media_ponderata, media_avanzamenti, ps, I1, I2, alpha):
+    """Combina le componenti con i pesi I1/I2 e calcola il punteggio P.
+
+    Restituisce gli array (punteggio, ps, ponderata_combinata, media_ponderata,
+    media_avanzamenti).
+    """
+    ponderata_combinata = (I1 * media_ponderata + I2 * media_avanzamenti) / 100
+    punteggio = calcola_punteggio_P(ponderata_combinata, ps, alpha)
+    return punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti
+
+
+def calcola_punteggi(modello, codici_funzione, posizioni, I1, I2, alpha):
+    """Calcola i punteggi per i negozi `posizioni` già filtrati come eleggibili.
+
+    Restituisce gli array (punteggio, ps, ponderata_combinata, media_ponderata,
+    media_avanzamenti) allineati a `posizioni`.
+    """
+    return combina_punteggi(*calcola_componenti(modello, codici_funzione, posizioni), I1, I2, alpha)
+
+
+class CacheComponenti:
+    """Componenti del punteggio per insieme di funzioni su tutti i negozi eleggibili.
+
+    Media ponderata, media avanzamenti e percentuale stock dipendono solo
+    dalle tabelle: restano valide quando cambiano I1, alpha, soglia
+    delivered o moltiplicatore, e vengono condivise dalle `CachePunteggi`
+    dei vari scenari costruite sullo stesso `ModelloDati`.
+
+    Anche i punteggi combinati non dipendono da soglia e moltiplicatore:
+    vengono conservati per gli ultimi `MAX_PESI_COMBINATI` insiemi di pesi
+    (I1, I2, alpha), così gli scenari che cambiano solo le soglie non
+    ripetono la combinazione.
+    """
+
+    def __init__(self, modello):
+        self.modello = modello
+        self.tutti_negozi = np.arange(len(modello.negozi))
+        self.voci = {}
+        self.combinati = OrderedDict()
+        self.hit = 0
+        self.miss = 0
+
+    def componenti(self, codici_funzione):
+        """Restituisce (eleggibili, (media_ponderata, media_avanzamenti, ps))."""
+        chiave = tuple(codici_funzione)
+        voce = self.voci.get(chiave)
+        if voce is None:
+            self.miss += 1
+            eleggibili = negozi_eleggibili(self.modello, codici_funzione, self.tutti_negozi)
+            voce = (eleggibili, calcola_componenti(self.modello, codici_funzione, eleggibili))
+            self.voci[chiave] = voce
+        else:
+            self.hit += 1
+        return voce
+
+    def punteggi(self, codici_funzione, I1, I2, alpha):
+        """Restituisce (eleggibili, punteggi) con i pesi indicati, su tutti i negozi eleggibili."""
+        pesi = (I1, I2, alpha)
+        voci = self.combinati.get(pesi)
+        if voci is None:
+            voci = self.combinati[pesi] = {}
+            if len(self.combinati) > MAX_PESI_COMBINATI:
+                self.combinati.popitem(last=False)
+        else:
+            self.combinati.move_to_end(pesi)
+        chiave = tuple(codici_funzione)
+        voce = voci.get(chiave)
+        if voce is None:
+            eleggibili, componenti = self.componenti(codici_funzione)
+            voce = voci[chiave] = (eleggibili, combina_punteggi(*componenti, I1, I2, alpha))
+        return voce
+
+
+class CachePunteggi:
+    """Punteggi per insieme di funzioni su tutti i negozi validi eleggibili.
+
+    Il punteggio di un negozio per un insieme di funzioni non dipende da
+    quali negozi sono già stati assegnati: viene calcolato una sola volta
+    per tutti i negozi validi e riusato da tutti i pallet con le stesse
+    funzioni, nel primo passaggio come nella riassegnazione. La
+    disponibilità dei negozi si applica dopo, filtrando i candidati.
+
+    Con una `CacheComponenti` in `componenti` i punteggi vengono presi dai
+    punteggi combinati di quella cache per gli stessi I1, I2 e alpha e
+    filtrati sui negozi validi: la combinazione è elemento per elemento,
+    quindi filtrare prima o dopo dà gli stessi valori.
+    """
+
+    def __init__(self, modello, negozi_validi, I1, I2, alpha, componenti=None):
+        self.modello = modello
+        self.componenti = componenti
+        self.negozi_validi = negozi_validi
+        self.maschera_validi = np.zeros(len(modello.negozi), dtype=bool)
+        self.maschera_validi[negozi_validi] = True
+        self.I1 = I1
+        self.I2 = I2
+        self.alpha = alpha
+        self.voci = {}
+        self.hit = 0
+        self.miss = 0
+
+    def punteggi(self, codici_funzione):
+        """Restituisce (candidati, punteggi) con i candidati in ordine di posizione.
+
+        `punteggi` è la tupla di array di `calcola_punteggi` allineata ai candidati.
+        """
+        chiave = tuple(codici_funzione)
+        voce = self.voci.get(chiave)
+        if voce is None:
+            self.miss += 1
+            if self.componenti is None:
+                candidati = negozi_eleggibili(self.modello, codici_funzione, self.negozi_validi)
+                voce = (candidati, calcola_punteggi(self.modello, codici_funzione, candidati, self.I1, self.I2, self.alpha))
+            else:
+                eleggibili, punteggi = self.componenti.punteggi(codici_funzione, self.I1, self.I2, self.alpha)
+                validi = self.maschera_validi[eleggibili]
+                voce = (eleggibili[validi], tuple(valori[validi] for valori in punteggi))
+            self.voci[chiave] = voce
+        else:
+            self.hit += 1
+        return voce
@@ -0,0 +1,128 @@
+"""Calcolo dei punteggi su più processi.
+
+Il calcolo dei punteggi di ogni insieme di funzioni su tutti i negozi è
+indipendente dagli altri; solo l'assegnazione (negozi liberi, valori
+assegnati) è sequenziale. Qui gli insiemi di funzioni vengono suddivisi
+in blocchi e calcolati da un pool di processi, poi caricati nella
+`CachePunteggi` che il passaggio greedy consuma in ordine come sempre: il
+risultato coincide esattamente con quello a processo singolo. Se la cache
+usa una `CacheComponenti` (app, scenari) i processi calcolano le sole
+componenti mancanti, che la `CachePunteggi` combina poi con I1, I2 e alpha.
+
+Le matrici del `ModelloDati` arrivano ai processi tramite memoria
+condivisa (`multiprocessing.shared_memory`), non come DataFrame serializzati.
+
+I processi vengono avviati con `spawn`, non con `fork`: il pool parte
+anche dal thread di un `lavori.LavoroAssegnazione` dentro il server
+Streamlit, e un processo figlio ottenuto con fork da un processo con più
+thread può bloccarsi su lock tenuti da altri thread (import, logging).
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from modello_dati import ModelloDati
+from punteggi import calcola_componenti, calcola_punteggi, negozi_eleggibili
+
+# Avvio dei processi del pool, uguale su tutte le piattaforme
+CONTESTO_PROCESSI = multiprocessing.get_context('spawn')
+
+# Stato di ogni processo del pool, impostato dall'inizializzatore
+_modello_processo = None
+_parametri_processo = None
+_blocchi_processo = []
+
+
+def condividi_array(modello):
+    """Copia gli array del modello in blocchi di memoria condivisa.
+
+    Restituisce (blocchi, descrittori); i blocchi vanno chiusi e rilasciati
+    con `rilascia_blocchi` dal processo che li ha creati.
+    """
+    blocchi = []
+    descrittori = {}
+    for nome in ModelloDati.ARRAY:
+        array = np.ascontiguousarray(getattr(modello, nome))
+        blocco = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=blocco.buf)[...] = array
+        blocchi.append(blocco)
+        descrittori[nome] = (blocco.name, array.shape, array.dtype.str)
+    return blocchi, descrittori
+
+
+def rilascia_blocchi(blocchi):
+    for blocco in blocchi:
+        blocco.close()
+        blocco.unlink()
+
+
+def _inizializza_processo(mappe, descrittori, negozi_validi, I1, I2, alpha):
+    global _modello_processo, _parametri_processo
+    array = {}
+    for nome, (nome_blocco, forma, tipo) in descrittori.items():
+        blocco = shared_memory.SharedMemory(name=nome_blocco)
+        _blocchi_processo.append(blocco)
+        array[nome] = np.ndarray(forma, dtype=np.dtype(tipo), buffer=blocco.buf)
+    _modello_processo = ModelloDati.da_array(mappe, array)
+    _parametri_processo = (negozi_validi, I1, I2, alpha)
+
+
+def _calcola_blocco(insiemi_codici):
+    negozi_validi, I1, I2, alpha = _parametri_processo
+    risultati = []
+    for codici_funzione in insiemi_codici:
+        candidati = negozi_eleggibili(_modello_processo, list(codici_funzione), negozi_validi)
+        punteggi = calcola_punteggi(_modello_processo, list(codici_funzione), candidati, I1, I2, alpha)
+        risultati.append((codici_funzione, candidati, punteggi))
+    return risultati
+
+
+def _calcola_blocco_componenti(insiemi_codici):
+    tutti_negozi = np.arange(len(_modello_processo.negozi))
+    risultati = []
+    for codici_funzione in insiemi_codici:
+        eleggibili = negozi_eleggibili(_modello_processo, list(codici_funzione), tutti_negozi)
+        componenti = calcola_componenti(_modello_processo, list(codici_funzione), eleggibili)
+        risultati.append((codici_funzione, eleggibili, componenti))
+    return risultati
+
+
+def precalcola_punteggi(cache, insiemi_codici, workers, dimensione_blocco=None):
+    """Calcola in parallelo i punteggi degli insiemi non ancora in `cache`.
+
+    Con una `CacheComponenti` in `cache.componenti` vengono calcolate in
+    parallelo le componenti non ancora presenti in quella cache. Con
+    `workers` <= 1 il calcolo avviene nel processo corrente.
+    """
+    componenti = cache.componenti
+    mancanti = [
+        codici for codici in dict.fromkeys(tuple(c) for c in insiemi_codici)
+        if codici not in cache.voci and (componenti is None or codici not in componenti.voci)
+    ]
+    if workers <= 1 or len(mancanti) < 2:
+        for codici in mancanti:
+            cache.punteggi(list(codici))
+        return
+
+    if dimensione_blocco is None:
+        dimensione_blocco = max(1, -(-len(mancanti) // (workers * 4)))
+    blocchi_insiemi = [mancanti[i:i + dimensione_blocco] for i in range(0, len(mancanti), dimensione_blocco)]
+    mappe = {nome: getattr(cache.modello, nome) for nome in ModelloDati.MAPPE}
+    blocchi, descrittori = condividi_array(cache.modello)
+    calcola, destinazione = (_calcola_blocco, cache) if componenti is None else (_calcola_blocco_componenti, componenti)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=CONTESTO_PROCESSI,
+            initializer=_inizializza_processo,
+            initargs=(mappe, descrittori, cache.negozi_validi, cache.I1, cache.I2, cache.alpha),
+        ) as pool:
+            for risultati in pool.map(calcola, blocchi_insiemi):
+                for codici_funzione, candidati, valori in risultati:
+                    destinazione.voci[codici_funzione] = (candidati, valori)
+                    destinazione.miss += 1
+    finally:
+        rilascia_blocchi(blocchi)
+
@@ -0,0 +1,148 @@
+"""Misure di prestazione della pipeline: tempo, chiamate e righe per fase.
+
+Le fasi della pipeline (`fase`) e le funzioni di calcolo più chiamate
+(`misurato`) registrano le proprie misure nel `RegistroPrestazioni`
+attivo nel contesto corrente; senza un registro attivo il costo è un solo
+controllo. Alla chiusura di `registra_prestazioni` ogni misura viene
+scritta come riga di log JSON sul logger `assegnazione.prestazioni` e, se
+richiesto, viene prodotto il report cProfile dell'esecuzione.
+
+Il logger non ha handler propri: `configura_log` ne aggiunge uno su stderr
+(usato dall'app Streamlit e dalla CLI con --prestazioni); altrimenti le
+righe seguono la configurazione di logging dell'applicazione che importa
+il modulo.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import pandas as pd
+
+logger = logging.getLogger('assegnazione.prestazioni')
+
+_registro_attivo = ContextVar('registro_prestazioni', default=None)
+
+# Righe del report cProfile, ordinate per tempo cumulativo
+RIGHE_PROFILO = 60
+
+
+def configura_log(stream=None, livello=logging.INFO):
+    """Scrive le righe di log delle prestazioni su `stream` (stderr se omesso).
+
+    Può essere chiamata più volte, ad esempio a ogni rerun di Streamlit:
+    l'handler viene aggiunto una sola volta. Le righe non vengono
+    propagate al logger radice, così non compaiono due volte.
+    """
+    logger.setLevel(livello)
+    if not any(getattr(handler, '_prestazioni', False) for handler in logger.handlers):
+        handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler._prestazioni = True
+        logger.addHandler(handler)
+    logger.propagate = False
+
+
+class Misura:
+    """Righe elaborate da una fase, impostabili quando la fase è in corso."""
+
+    __slots__ = ('righe',)
+
+    def __init__(self, righe=None):
+        self.righe = righe
+
+
+class RegistroPrestazioni:
+    """Tempo totale, numero di chiamate e righe elaborate per fase o funzione."""
+
+    def __init__(self):
+        self.misure = {}
+        self.profilo = None
+
+    def aggiungi(self, nome, tempo, righe=None):
+        misura = self.misure.get(nome)
+        if misura is None:
+            misura = self.misure[nome] = {'tempo_s': 0.0, 'chiamate': 0, 'righe': 0}
+        misura['tempo_s'] += tempo
+        misura['chiamate'] += 1
+        if righe is not None:
+            misura['righe'] += righe
+
+    def tabella(self):
+        """DataFrame delle misure, una riga per fase o funzione."""
+        return pd.DataFrame.from_dict(self.misure, orient='index', columns=['tempo_s', 'chiamate', 'righe'])
+
+    def scrivi_log(self):
+        for nome, misura in self.misure.items():
+            logger.info(json.dumps({'evento': 'prestazioni', 'nome': nome, **misura}, ensure_ascii=False))
+
+
+@contextmanager
+def registra_prestazioni(registro=None, profila=False):
+    """Attiva un registro (nuovo o `registro`) per il blocco e lo restituisce.
+
+    Con `profila` il blocco viene eseguito sotto cProfile e il report
+    testuale è disponibile in `registro.profilo`.
+    """
+    if registro is None:
+        registro = RegistroPrestazioni()
+    token = _registro_attivo.set(registro)
+    profiler = cProfile.Profile() if profila else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield registro
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(RIGHE_PROFILO)
+            registro.profilo = report.getvalue()
+        _registro_attivo.reset(token)
+        registro.scrivi_log()
+
+
+@contextmanager
+def fase(nome, righe=None):
+    """Misura una fase della pipeline nel registro attivo, se presente.
+
+    Restituisce una `Misura` in cui indicare le righe elaborate quando
+    sono note solo alla fine della fase.
+    """
+    registro = _registro_attivo.get()
+    misura = Misura(righe)
+    if registro is None:
+        yield misura
+        return
+    inizio = time.perf_counter()
+    try:
+        yield misura
+    finally:
+        registro.aggiungi(nome, time.perf_counter() - inizio, misura.righe)
+
+
+def misurato(argomento_righe):
+    """Decoratore: registra tempo e chiamate della funzione nel registro attivo.
+
+    Le righe elaborate sono la lunghezza dell'argomento posizionale di
+    indice `argomento_righe`.
+    """
+    def decoratore(funzione):
+        @wraps(funzione)
+        def avvolta(*args, **kwargs):
+            registro = _registro_attivo.get()
+            if registro is None:
+                return funzione(*args, **kwargs)
+            inizio = time.perf_counter()
+            try:
+                return funzione(*args, **kwargs)
+            finally:
+                registro.aggiungi(funzione.__name__, time.perf_counter() - inizio, len(args[argomento_righe]))
+        return avvolta
+    return decoratore
@@ -0,0 +1,49 @@
+"""Dati comuni dei test: tabelle sintetiche di `dati_sintetici` scritte su file.
+
+I moduli dell'applicazione sono nella radice del repository, che viene
+aggiunta al percorso di import.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dati_sintetici import genera_tabelle, scrivi_file  # noqa: E402
+
+# Dimensioni piccole: i test confrontano risultati, non misurano tempi
+DIMENSIONI = dict(n_negozi=120, n_funzioni=30, n_pallet=200)
+
+# Con le dimensioni di prova il Total Delivered dei negozi è nell'ordine delle decine di migliaia
+SOGLIA_DELIVERED = 1000
+
+
+def con_codici_numerici(tabelle):
+    """Tabelle con codici negozio numerici e ID_PRELIEVO in parte alfanumerici.
+
+    Nei risultati `Negozio Assegnato` mescola allora codici numerici e
+    "Nessun negozio disponibile", come nei file reali.
+    """
+    df_st, df_avanzamenti, df_prelievi, df_stock = (df.copy() for df in tabelle)
+    codici = {nome: 10000 + i for i, nome in enumerate(df_st['Des Negozio'].iloc[2:])}
+    df_st['Des Negozio'] = df_st['Des Negozio'].astype(object)
+    df_st.iloc[2:, 0] = df_st.iloc[2:, 0].map(codici)
+    df_avanzamenti['Des Negozio'] = df_avanzamenti['Des Negozio'].map(codici)
+    df_stock['Des Negozio'] = df_stock['Des Negozio'].map(codici)
+    df_prelievi['ID_PRELIEVO'] = df_prelievi['ID_PRELIEVO'].astype(object)
+    df_prelievi.loc[::7, 'ID_PRELIEVO'] = [f"P{i}" for i in range(len(df_prelievi.loc[::7]))]
+    return df_st, df_avanzamenti, df_prelievi, df_stock
+
+
+@pytest.fixture(scope='session')
+def file_sintetici(tmp_path_factory):
+    """Percorsi dei quattro file Excel generati, nell'ordine di `carica_tabelle`."""
+    return scrivi_file(tmp_path_factory.mktemp('sintetici'), genera_tabelle(**DIMENSIONI, seed=1))
+
+
+@pytest.fixture(scope='session')
+def file_codici_numerici(tmp_path_factory):
+    """Come `file_sintetici`, con i codici di `con_codici_numerici`."""
+    tabelle = con_codici_numerici(genera_tabelle(**DIMENSIONI, seed=2))
+    return scrivi_file(tmp_path_factory.mktemp('codici_numerici'), tabelle)
@@ -0,0 +1,181 @@
+"""Algoritmo originale dell'app, negozio per negozio, usato come riferimento.
+
+Lettura dei file e assegnazione sono quelle della prima versione di
+`assegnazioni_app.py`, senza Streamlit. Unica differenza: i negozi sono
+visitati nell'ordine della tabella ST invece che nell'ordine di un `set`,
+che con nomi testuali dipende dal seme di hash e decide solo i pari merito.
+"""
+import pandas as pd
+
+NESSUN_NEGOZIO = "Nessun negozio disponibile"
+
+
+def leggi_tabelle(percorso_st, percorso_avanzamenti, percorso_prelievi, percorso_stock):
+    """Legge e normalizza i quattro file come l'app originale."""
+    df = pd.read_excel(percorso_st, header=0)
+    numeri_colonne = df.iloc[0, 1::3].values
+    nuove_intestazioni = ['Des Negozio']
+    for numero in numeri_colonne:
+        nuove_intestazioni.append(f"{numero} Somma di Total Delivered")
+        nuove_intestazioni.append(f"{numero} Somma di Total Sales")
+        nuove_intestazioni.append(f"{numero} Media di ST value")
+    df.columns = nuove_intestazioni
+    df = df.drop(index=0)
+    df = df.drop(index=1).reset_index(drop=True)
+    df = df.dropna(subset=["Des Negozio"])
+    df = df.fillna(0)
+
+    df_avanzamenti = pd.read_excel(percorso_avanzamenti).fillna(0)
+    for codice in set(df['Des Negozio']) - set(df_avanzamenti['Des Negozio']):
+        nuova_riga = pd.DataFrame({'Des Negozio': [codice], 'Valore': [0]})
+        df_avanzamenti = pd.concat([df_avanzamenti, nuova_riga], ignore_index=True)
+    df_avanzamenti = df_avanzamenti.fillna(0)
+
+    df_prelievi = pd.read_excel(percorso_prelievi).fillna(0)
+
+    df_stock = pd.read_excel(percorso_stock).fillna(0)
+    for codice in set(df['Des Negozio']) - set(df_stock['Des Negozio']):
+        nuova_riga = pd.DataFrame({'Des Negozio': [codice], 'Valore': [0]})
+        df_stock = pd.concat([df_stock, nuova_riga], ignore_index=True)
+    df_stock = df_stock.fillna(0)
+    return df, df_avanzamenti, df_prelievi, df_stock
+
+
+def assegna(df_negozi, df_avanzamenti, df_prelievi, df_stock, I1, alpha, soglia_delivered, soglia_massima_moltiplicatore):
+    """Assegnazione e riassegnazione automatica dell'app originale."""
+    I2 = 100 - I1
+    df_prelievi = df_prelievi.copy()
+    df_prelievi['Valore Totale'] = df_prelievi.drop(columns=['ID_PRELIEVO']).sum(axis=1)
+
+    negozi_disponibili = list(dict.fromkeys(df_negozi['Des Negozio']))
+
+    def calcola_totale_delivered(row):
+        return sum([row[col] for col in row.index if "Total Delivered" in col])
+
+    negozi_validi = {
+        negozio: calcola_totale_delivered(df_negozi[df_negozi['Des Negozio'] == negozio].iloc[0])
+        for negozio in negozi_disponibili
+        if calcola_totale_delivered(df_negozi[df_negozi['Des Negozio'] == negozio].iloc[0]) >= soglia_delivered
+    }
+    negozi_map = {negozio: df_negozi[df_negozi['Des Negozio'] == negozio].iloc[0] for negozio in negozi_validi}
+
+    def calcola_media_avanzamenti(codici_funzione, negozio):
+        avanzamenti = []
+        for codice in codici_funzione:
+            if codice in df_avanzamenti.columns:
+                avanzamenti.append(df_avanzamenti.loc[df_avanzamenti['Des Negozio'] == negozio, codice].mean())
+            else:
+                avanzamenti.append(0)
+        return sum(avanzamenti) / len(avanzamenti) if avanzamenti else 0
+
+    def calcola_media_ponderata_combinata(codici_funzione, negozio):
+        media_ponderata = calcola_media_ponderata_con_controllo(codici_funzione, negozi_map[negozio])
+        media_avanzamenti = calcola_media_avanzamenti(codici_funzione, negozio)
+        return (I1 * media_ponderata + I2 * media_avanzamenti) / 100, media_ponderata, media_avanzamenti
+
+    def calcola_media_ponderata_con_controllo(codici_funzione, negozio_row):
+        total_weighted_st = 0
+        total_delivered = 0
+        for codice in codici_funzione:
+            col_delivered = f"{codice} Somma di Total Delivered"
+            col_st = f"{codice} Media di ST value"
+            if col_delivered in negozio_row.index and col_st in negozio_row.index:
+                delivered_value = negozio_row[col_delivered]
+                st_value = negozio_row[col_st]
+                if delivered_value > 0:
+                    total_weighted_st += st_value * delivered_value
+                    total_delivered += delivered_value
+        return total_weighted_st / total_delivered if total_delivered > 0 else 0
+
+    def calcola_stock_totale(codici_funzione):
+        return df_stock[[codice for codice in codici_funzione if codice in df_stock.columns]].sum().sum()
+
+    def calcola_stock_negozio(codici_funzione, negozio):
+        return df_stock.loc[df_stock['Des Negozio'] == negozio, [
+            codice for codice in codici_funzione if codice in df_stock.columns
+        ]].sum().sum()
+
+    def calcola_punteggio_P(media_ponderata_combinata, codici_funzione, negozio):
+        stock_totale_funzioni = calcola_stock_totale(codici_funzione)
+        stock_funzioni_negozio = calcola_stock_negozio(codici_funzione, negozio)
+        ps = stock_funzioni_negozio / stock_totale_funzioni if stock_totale_funzioni > 0 else 0
+        if media_ponderata_combinata < 0:
+            media_ponderata_combinata = 0
+        return (media_ponderata_combinata**alpha) / (1 + ps**(1 - alpha))
+
+    def punteggi_negozio(codici_funzione, negozio):
+        ponderata_combinata, media_ponderata, media_avanzamenti = calcola_media_ponderata_combinata(codici_funzione, negozio)
+        punteggio = calcola_punteggio_P(ponderata_combinata, codici_funzione, negozio)
+        stock_totale_funzioni = calcola_stock_totale(codici_funzione)
+        stock_funzioni_negozio = calcola_stock_negozio(codici_funzione, negozio)
+        ps = stock_funzioni_negozio / stock_totale_funzioni if stock_totale_funzioni > 0 else 0
+        return negozio, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti
+
+    def eleggibile(negozio, codici_funzione):
+        negozio_row = negozi_map[negozio]
+        return all(negozio_row.get(f"{codice} Somma di Total Delivered", 0) > 0 for codice in codici_funzione)
+
+    results = []
+    negozi_assegnati = set()
+    valori_assegnati = {negozio: 0 for negozio in negozi_validi}
+
+    for _, row in df_prelievi.iterrows():
+        id_prelievo = row['ID_PRELIEVO']
+        valore_totale = row['Valore Totale']
+        codici_funzione = [col for col in row.index if col != 'ID_PRELIEVO' and col != "Valore Totale" and row[col] > 0]
+
+        funzioni_non_presenti = [codice for codice in codici_funzione if f"{codice} Somma di Total Delivered" not in df_negozi.columns]
+        if len(funzioni_non_presenti) == len(codici_funzione):
+            results.append([str(id_prelievo), "Nessun negozio disponibile (TUTTE FUNZIONI NON PRESENTI)", 0, 0, 0, 0, 0,
+                            ",".join(map(str, funzioni_non_presenti)), valore_totale])
+            continue
+        if funzioni_non_presenti:
+            codici_funzione = [codice for codice in codici_funzione if codice not in funzioni_non_presenti]
+
+        negozi_e_ponderate = [
+            punteggi_negozio(codici_funzione, negozio) for negozio in negozi_validi
+            if negozio not in negozi_assegnati and eleggibile(negozio, codici_funzione)
+        ]
+        negozi_e_ponderate.sort(key=lambda x: x[1], reverse=True)
+        if negozi_e_ponderate:
+            negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti = negozi_e_ponderate[0]
+            valori_assegnati[negozio_assegnato] += valore_totale
+            negozi_assegnati.add(negozio_assegnato)
+            results.append([str(id_prelievo), negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata,
+                            media_avanzamenti, ",".join(map(str, codici_funzione)), valore_totale])
+        else:
+            results.append([str(id_prelievo), NESSUN_NEGOZIO, 0, 0, 0, 0, 0, ",".join(map(str, codici_funzione)), valore_totale])
+
+    df_results = pd.DataFrame(results, columns=[
+        "ID_PRELIEVO", "Negozio Assegnato", "Punteggio", "Percentuale Stock", "Media Ponderata Combinata",
+        "Media Ponderata", "Media Avanzamenti", "Funzioni presenti", "Valore Totale",
+    ])
+    df_results['ID_PRELIEVO'] = df_results['ID_PRELIEVO'].apply(lambda x: str(x).split('.')[0] if '.' in str(x) else str(x))
+
+    # Riassegnazione automatica dei pallet mancanti
+    pallet_non_assegnati = df_results[df_results["Negozio Assegnato"] == NESSUN_NEGOZIO]
+    if not pallet_non_assegnati.empty:
+        soglia_massima = df_prelievi['Valore Totale'].max() * soglia_massima_moltiplicatore
+        pallet_assegnati_nella_riassegnazione = set()
+        for _, row in pallet_non_assegnati.iterrows():
+            id_prelievo = row['ID_PRELIEVO']
+            valore_totale = row['Valore Totale']
+            codici_funzione = [int(codice) for codice in row['Funzioni presenti'].split(',') if codice.strip().isdigit()]
+
+            negozi_e_ponderate = [
+                punteggi_negozio(codici_funzione, negozio) for negozio in negozi_validi
+                if valori_assegnati[negozio] + valore_totale <= soglia_massima
+                and negozio not in pallet_assegnati_nella_riassegnazione
+                and eleggibile(negozio, codici_funzione)
+            ]
+            negozi_e_ponderate.sort(key=lambda x: x[1], reverse=True)
+            if negozi_e_ponderate:
+                negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti = negozi_e_ponderate[0]
+                df_results.loc[df_results['ID_PRELIEVO'] == id_prelievo, [
+                    'Negozio Assegnato', 'Punteggio', 'Percentuale Stock', 'Media Ponderata Combinata',
+                    'Media Ponderata', 'Media Avanzamenti',
+                ]] = [negozio_assegnato, punteggio, ps, ponderata_combinata, media_ponderata, media_avanzamenti]
+                valori_assegnati[negozio_assegnato] += valore_totale
+                pallet_assegnati_nella_riassegnazione.add(negozio_assegnato)
+
+    return df_results
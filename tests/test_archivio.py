@@ -0,0 +1,61 @@
+"""Un run riletto dall'archivio deve essere identico a quello calcolato."""
+import pytest
+
+import archivio
+from archivio import ArchivioRun, chiave_run
+from assegnazione import NESSUN_NEGOZIO, ParametriAssegnazione, assign_pallets, confronta_modalita
+from conftest import SOGLIA_DELIVERED
+from ingestione import carica_tabelle
+
+
+@pytest.fixture(scope='module')
+def tabelle(file_codici_numerici):
+    return carica_tabelle(*file_codici_numerici)
+
+
+@pytest.fixture(scope='module')
+def params():
+    return ParametriAssegnazione(soglia_delivered=SOGLIA_DELIVERED)
+
+
+def tipi(serie):
+    return [type(valore) for valore in serie]
+
+
+def test_run_riletto_uguale_al_calcolato(tmp_path, tabelle, params):
+    df_results = assign_pallets(*tabelle, params)
+    df_confronto, _ = confronta_modalita(*tabelle, params)
+    negozi = df_results['Negozio Assegnato']
+    # La colonna deve davvero mescolare codici numerici e testo
+    assert (negozi == NESSUN_NEGOZIO).any() and (negozi != NESSUN_NEGOZIO).any()
+
+    chiave = ArchivioRun(tmp_path).salva_run('ingresso', params, df_results, df_confronto)
+    _, riletti, confronto = ArchivioRun(tmp_path).carica_run(chiave)
+
+    assert riletti.equals(df_results)
+    assert tipi(riletti['Negozio Assegnato']) == tipi(negozi)
+    assert confronto.equals(df_confronto)
+
+
+def test_tabelle_in_ingresso_rilette_uguali(tmp_path, tabelle):
+    archivio_run = ArchivioRun(tmp_path)
+    archivio_run.salva_ingresso('ingresso', tabelle, file=['ST.xlsx'])
+    riletti = archivio_run.carica_ingresso('ingresso')
+
+    for originale, riletto in zip(tabelle, riletti):
+        assert riletto.equals(originale)
+        assert list(riletto.columns) == list(originale.columns)
+        assert riletto.attrs == originale.attrs
+    assert tipi(riletti[2]['ID_PRELIEVO']) == tipi(tabelle[2]['ID_PRELIEVO'])
+
+
+def test_chiave_cambia_con_la_versione_dell_algoritmo(monkeypatch, params):
+    chiave = chiave_run('ingresso', params)
+    monkeypatch.setattr(archivio, 'VERSIONE_ALGORITMO', archivio.VERSIONE_ALGORITMO + 1)
+    assert chiave_run('ingresso', params) != chiave
+
+
+def test_chiave_ignora_i_workers(params):
+    assert chiave_run('ingresso', params) == chiave_run('ingresso', ParametriAssegnazione(
+        soglia_delivered=SOGLIA_DELIVERED, workers=4
+    ))
@@ -0,0 +1,85 @@
+"""I risultati del motore coincidono con quelli dell'algoritmo originale.
+
+Il riferimento è `originale.assegna`, il ciclo negozio per negozio della
+prima versione dell'app, sugli stessi file generati da `dati_sintetici`.
+"""
+from dataclasses import replace
+
+import pandas as pd
+import pytest
+
+import originale
+from assegnazione import ParametriAssegnazione, assegna_pallet_in_streaming, assign_pallets
+from dati_sintetici import genera_tabelle, scrivi_file
+from ingestione import FlussoPrelievi, carica_tabelle, carica_tabelle_negozi
+
+# Pochi negozi e pallet: il riferimento legge i DataFrame riga per riga. Con
+# 120 pallet e 40 negozi metà dei pallet passa dalla riassegnazione.
+DIMENSIONI_RIFERIMENTO = dict(n_negozi=40, n_funzioni=12, n_pallet=120)
+
+# Alpha nullo escluso: tutti i punteggi valgono 1 e l'originale sceglie tra
+# pari merito nell'ordine di un set
+PARAMETRI = {
+    'predefiniti': ParametriAssegnazione(soglia_delivered=15000),
+    'pesi e soglie': ParametriAssegnazione(I1=40, alpha=0.3, soglia_delivered=0, soglia_massima_moltiplicatore=1.5),
+    'alpha 1': ParametriAssegnazione(alpha=1.0, soglia_delivered=15000),
+}
+
+
+@pytest.fixture(scope='module')
+def file_riferimento(tmp_path_factory):
+    return scrivi_file(tmp_path_factory.mktemp('riferimento'), genera_tabelle(**DIMENSIONI_RIFERIMENTO, seed=3))
+
+
+@pytest.fixture(scope='module')
+def tabelle(file_riferimento):
+    return carica_tabelle(*file_riferimento)
+
+
+@pytest.fixture(scope='module')
+def riferimento(file_riferimento):
+    """Risultati dell'algoritmo originale per nome dei parametri, calcolati una volta."""
+    tabelle_originali = originale.leggi_tabelle(*file_riferimento)
+    return {
+        nome: originale.assegna(
+            *tabelle_originali, params.I1, params.alpha, params.soglia_delivered, params.soglia_massima_moltiplicatore
+        )
+        for nome, params in PARAMETRI.items()
+    }
+
+
+def confronta(atteso, ottenuto):
+    """Stessi valori, colonna per colonna; i tipi numerici possono differire (int e float)."""
+    assert list(ottenuto.columns) == list(atteso.columns)
+    for colonna in atteso.columns:
+        assert ottenuto[colonna].tolist() == atteso[colonna].tolist(), colonna
+
+
+def test_riferimento_passa_dalla_riassegnazione(riferimento):
+    # Solo la riassegnazione dà a un negozio un secondo pallet
+    negozi = riferimento['predefiniti']['Negozio Assegnato']
+    assert negozi[negozi.str.startswith('NEGOZIO')].value_counts().max() > 1
+
+
+@pytest.mark.parametrize('nome', PARAMETRI)
+def test_greedy_uguale_all_originale(tabelle, riferimento, nome):
+    confronta(riferimento[nome], assign_pallets(*tabelle, PARAMETRI[nome]))
+
+
+def test_piu_processi_uguale_all_originale(tabelle, riferimento):
+    confronta(riferimento['predefiniti'], assign_pallets(*tabelle, replace(PARAMETRI['predefiniti'], workers=2)))
+
+
+@pytest.mark.parametrize('formato', ['xlsx', 'csv'])
+def test_streaming_uguale_all_originale(tmp_path, file_riferimento, riferimento, formato):
+    percorso_st, percorso_avanzamenti, percorso_prelievi, percorso_stock = file_riferimento
+    if formato == 'csv':
+        percorso_csv = tmp_path / 'PRELIEVI.csv'
+        pd.read_excel(percorso_prelievi).to_csv(percorso_csv, index=False)
+        percorso_prelievi = percorso_csv
+    df, df_avanzamenti, df_stock = carica_tabelle_negozi(percorso_st, percorso_avanzamenti, percorso_stock)
+    flusso = FlussoPrelievi(percorso_prelievi, formato)
+
+    df_results = assegna_pallet_in_streaming(df, df_avanzamenti, df_stock, flusso.pallet(), PARAMETRI['predefiniti'])
+
+    confronta(riferimento['predefiniti'], df_results)